@@ -1,25 +1,18 @@
 """Extract word lists per speaker from Buckeye corpus.
 There are 40 speakers, each has up to 6 tracks (interviews).
-The word class has two attributes: word and pause. Pauses are filtered out since they do not have an orthography attribute.
+The words are read from the token table built by token_table.py. Pauses are filtered out since they do not have an orthography.
 
 Usage: 
     python buckeye_text.py
 """
 
-import buckeye
+from token_table import load_tokens, word_tokens
 
 if __name__ == "__main__":
-    corpus = buckeye.corpus("../data/buckeye_corpus/")
+    tokens = word_tokens(load_tokens(columns=["speaker", "orthography", "is_pause"]))
 
-    for speaker in corpus:
-        word_list = []
-
-        for track in speaker:
-            for word in track.words:
-                if hasattr(word, "orthography"):
-                    word_list.append(word.orthography)
-
-        new_file = open("../data/" + speaker.name + ".txt", "w")
-        for line in word_list:
+    for speaker, words in tokens.groupby("speaker", sort=False, observed=True):
+        new_file = open("../data/" + speaker + ".txt", "w")
+        for line in words["orthography"]:
             new_file.write(line + "\n")
         new_file.close()
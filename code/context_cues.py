@@ -0,0 +1,174 @@
+"""Context cues of all word tokens at once.
+
+The context of a token is the words around it, as the cues c.<word>. The neighbours of all tokens
+are found by shifting the array of word codes of the token table in either direction. A neighbour in
+another track or of another speaker is masked with -1, so the words at the edges of a track only
+get the context cues of the neighbours they have, and a cue string is only ever built from the
+neighbours that exist.
+
+By default the context is the word before and the word after a token. A ContextConfig widens it
+to the window words on either side, optionally adds the bigrams of the two words before and after
+a token as cues c.<word>+<word>, and bounds the number of context cues: cues seen in fewer than
+min_count tokens are dropped, only the max_cues most frequent are kept, and with buckets every cue
+is hashed into one of that many cues c.#<bucket>. eventfilesV1.py saves the config it used to
+../data/context.json, so prior_activation.py builds the same context cues.
+
+Usage:
+    from context_cues import ContextConfig, context_strings
+
+    tokens = word_tokens(load_tokens(), exclude=forbidden_words)
+    tokens = tokens.assign(context=context_strings(tokens, ContextConfig(window=2)))
+"""
+
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+CONTEXT_CONFIG = "../data/context.json"
+
+
+class ContextConfig:
+    """Which context cues are built for a token.
+
+    Input:
+    -----
+    window - int
+        Number of words on either side of a token.
+    bigrams - bool
+        Whether the two words before and the two words after a token are also a cue.
+    min_count - int
+        Context cues seen in fewer tokens are dropped.
+    max_cues - int or None
+        Only the most frequent context cues are kept.
+    buckets - int or None
+        Number of buckets the context cues are hashed into.
+    """
+
+    def __init__(
+        self, window=1, bigrams=False, min_count=1, max_cues=None, buckets=None
+    ):
+        self.window = window
+        self.bigrams = bigrams
+        self.min_count = min_count
+        self.max_cues = max_cues
+        self.buckets = buckets
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    def save(self, path=CONTEXT_CONFIG):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=CONTEXT_CONFIG):
+        """Loads a saved config, or returns the default one if there is none."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def boundary_groups(tokens) -> np.ndarray:
+    """Returns the number of the track of every token, counting a new track whenever the speaker
+    or the track changes."""
+    speaker = tokens["speaker"].cat.codes.to_numpy()
+    track = tokens["track"].cat.codes.to_numpy()
+    new_track = np.r_[True, (speaker[1:] != speaker[:-1]) | (track[1:] != track[:-1])]
+    return np.cumsum(new_track)
+
+
+def neighbours(codes, groups, offset) -> np.ndarray:
+    """Returns the code of the token offset positions away from every token (negative for
+    tokens before it), or -1 if there is none in the same group."""
+    result = np.full(len(codes), -1, dtype=np.int64)
+    if offset < 0:
+        inside = groups[-offset:] == groups[:offset]
+        result[-offset:] = np.where(inside, codes[:offset], -1)
+    elif offset > 0:
+        inside = groups[:-offset] == groups[offset:]
+        result[:-offset] = np.where(inside, codes[offset:], -1)
+    else:
+        result[:] = codes
+    return result
+
+
+def bigram_slots(codes, groups, n_words) -> tuple:
+    """Returns the bigram cue IDs of the two words before and the two words after every token,
+    numbered from n_words on in the order of their keys, and the (first, second) word codes of
+    each bigram."""
+    slots = []
+    for first, second in ((-2, -1), (1, 2)):
+        first = neighbours(codes, groups, first)
+        second = neighbours(codes, groups, second)
+        slots.append(
+            np.where((first >= 0) & (second >= 0), first * n_words + second, -1)
+        )
+
+    keys, ids = np.unique(np.concatenate(slots), return_inverse=True)
+    present = keys >= 0
+    new_ids = np.cumsum(present) - 1 + n_words
+    ids = np.where(present[ids], new_ids[ids], -1)
+    keys = keys[present]
+    return np.split(ids, 2), (keys // n_words, keys % n_words)
+
+
+def context_cue_ids(tokens, config=None) -> tuple:
+    """Returns the context cue names and a token x slot array of IDs into them, one slot per
+    neighbour and bigram in the order the cues are joined, -1 where there is no cue."""
+    config = ContextConfig() if config is None else config
+    orthography = tokens["orthography"].cat.remove_unused_categories()
+    words = orthography.cat.categories
+    codes = orthography.cat.codes.to_numpy().astype(np.int64)
+    groups = boundary_groups(tokens)
+    names = ["c." + word for word in words]
+
+    # Nearest neighbours first, the word before before the word after.
+    slots = [
+        neighbours(codes, groups, sign * distance)
+        for distance in range(1, config.window + 1)
+        for sign in (-1, 1)
+    ]
+    if config.bigrams:
+        bigrams, (firsts, seconds) = bigram_slots(codes, groups, len(words))
+        slots.extend(bigrams)
+        names.extend(
+            "c.{}+{}".format(words[first], words[second])
+            for first, second in zip(firsts, seconds)
+        )
+    ids = np.column_stack(slots)
+    names = np.array(names, dtype=object)
+
+    # Prune the context cues by the number of tokens they occur with.
+    counts = np.bincount(ids[ids >= 0], minlength=len(names))
+    keep = counts >= config.min_count
+    if config.max_cues is not None and keep.sum() > config.max_cues:
+        ranked = np.argsort(-counts, kind="stable")
+        keep[ranked[config.max_cues :]] = False
+    ids = np.where((ids >= 0) & keep[np.maximum(ids, 0)], ids, -1)
+
+    if config.buckets is not None:
+        names = np.array(
+            [
+                "c.#{}".format(zlib.crc32(name.encode("utf-8")) % config.buckets)
+                for name in names
+            ],
+            dtype=object,
+        )
+    return names, ids
+
+
+def context_lists(tokens, config=None) -> list:
+    """Returns the list of context cues of every token, as token_activations takes them."""
+    names, ids = context_cue_ids(tokens, config)
+    return [[names[cue] for cue in row if cue >= 0] for row in ids.tolist()]
+
+
+def context_strings(tokens, config=None) -> pd.Series:
+    """Returns the context cue string of every token, e.g. 'c.the_c.barked'."""
+    return pd.Series(
+        ["_".join(cues) for cues in context_lists(tokens, config)], index=tokens.index
+    )
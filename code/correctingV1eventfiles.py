@@ -1,50 +1,44 @@
-"""Fix eventfile formatting by chaning the separator to tsv, removing the index column and merging into one file.
+"""Merge the individual speaker event files into the gzipped event file needed for running the
+NDL model. The files are streamed chunk by chunk, the index column left over from eventfilesV1.py
+is dropped on the way.
+While streaming, the events are also encoded as a binary corpus (see event_corpus.py), saved to
+../data/final_eventfile_buckeye.corpus/. The corpus is validated (see event_validation.py) and the
+report is written to ../data/final_eventfile_buckeye.validation.json. The merge fails if a
+regression word is no outcome.
 
 Usage:
-    python correctingV1eventfiles.py
+    python correctingV1eventfiles.py [--compresslevel 1-9]
 """
 
-import os
-import gzip
-import shutil
+import argparse
 
 import pandas as pd
 
-if __name__ == "__main__":
-    path = "../data/updated_eventfiles/"
-    all_ = []
+from event_corpus import CorpusBuilder, corpus_path
+from event_stream import merge_event_files, speaker_event_files
+from event_validation import EventValidator, write_report
 
-    for file in os.listdir(path):
-        df = pd.read_csv(
-            path + file,
-            low_memory=True,
-            dtype=({"outcomes": "category"}),
-            engine="c",
-            sep="\t",
-        )
-        df = df.drop(columns="Unnamed: 0")
-        df.to_csv(
-            "../data/updated_eventfiles/" + file,
-            sep="\t",
-            index=False,
-        )
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--compresslevel",
+        type=int,
+        default=9,
+        choices=range(1, 10),
+        help="gzip compression level of the merged event file.",
+    )
+    args = parser.parse_args()
 
-    # Merge the individual files again.
-    path = "../data/updated_eventfiles/"
-    all_ = []
+    files = speaker_event_files()
 
-    for file in os.listdir(path):
-        df = pd.read_csv(
-            path + file,
-            low_memory=True,
-            dtype=({"outcomes": "category"}),
-            engine="c",
-            sep="\t",
-        )
-        all_.append(df)
+    # Merge the individual files and encode the events on the way.
+    output = "../data/final_eventfile_buckeye.gz"
+    builder = CorpusBuilder(corpus_path(output))
+    merge_event_files(files, output, compresslevel=args.compresslevel, on_chunk=builder)
+    corpus = builder.finish()
 
-    big_df = pd.concat(all_)
-    concat_w = big_df["outcomes"].tolist()
+    validator = EventValidator()
+    validator.add_corpus(corpus)
 
     # Test if any words are missing.
     regression_words = pd.read_csv(
@@ -54,20 +48,6 @@ if __name__ == "__main__":
         engine="c",
         low_memory=True,
     )
-    regr_w = regression_words["wordID"].tolist()
-    missing = [w for w in regr_w if w not in concat_w]
-    assert len(missing) == 0
-
-    # Write final event file to file and create a gzipped version needed for running the NDL model.
-    big_df.to_csv(
-        "../data/final_eventfile_buckeye.tsv",
-        sep="\t",
-        index=False,
-    )
-
-    with open("../data/final_eventfile_buckeye.tsv", "rb") as f:
-        with gzip.open(
-            "../data/final_eventfile_buckeye.gz",
-            "wb",
-        ) as output:
-            shutil.copyfileobj(f, output)
+    report = validator.report(regression_words["wordID"].cat.categories)
+    write_report("../data/final_eventfile_buckeye.validation.json", report)
+    assert len(report["missing_outcomes"]) == 0, report["missing_outcomes"][:10]
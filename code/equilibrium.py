@@ -0,0 +1,163 @@
+"""Equilibrium weights of the Rescorla-Wagner model (Danks, 2003).
+
+At equilibrium the expected weight change of every cue-outcome pair is zero, which gives for every
+outcome o and cue i
+    sum_j P(j | i) V[j, o] = lambda P(o | i).
+Multiplied by the number of events with cue i, these are the linear equations C V = lambda O, with
+C the cue x cue matrix of how many events two cues occur in together and O the cue x outcome matrix
+of how many events a cue occurs in with an outcome. Both matrices are counted in one streaming pass
+over the event file, and the equations are solved for all outcomes at once, so the weights do not
+depend on the order of the events and no learning rates are needed.
+
+If cues always occur together, C is singular and the equilibrium is not unique. In Buckeye this is
+the rule rather than the exception: the syllable and often the context cues of a word seen once
+occur in exactly the same events. A small ridge added to the diagonal of C then picks (nearly) the
+solution with the smallest weights, which is why the ridge defaults to 1e-6. Without a ridge a
+singular C is solved with its pseudo-inverse instead.
+
+The equilibrium only depends on the ratio of the learning rates if the outcomes' presence and
+absence are learned at the same rate, so it is only the equilibrium of a model trained with
+beta1 == beta2.
+
+Usage:
+    from equilibrium import cooccurrence_counts, equilibrium_weights
+
+    C, O, cues, outcomes = cooccurrence_counts("../data/final_eventfile_buckeye.gz")
+    weights = equilibrium_weights(C, O, cues, outcomes)
+"""
+
+import numpy as np
+import scipy.linalg
+import xarray as xr
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
+from tqdm import tqdm
+
+from event_stream import read_event_chunks
+
+RIDGE = 1e-6
+
+
+def intern(labels, vocabulary) -> list:
+    """Returns the IDs of labels, adding new labels to the vocabulary dict."""
+    return [vocabulary.setdefault(label, len(vocabulary)) for label in labels]
+
+
+def grow(matrix, shape) -> sparse.csr_matrix:
+    """Returns a CSR matrix padded with zeros to shape."""
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=shape)
+
+
+def cooccurrence_counts(events, chunksize=100000) -> tuple:
+    """Counts the cue-cue and cue-outcome co-occurrences of an event file. Duplicate cues and
+    outcomes of an event are counted once, as pyndl does with remove_duplicates=True.
+
+    Returns:
+    -------
+    cue_cue - scipy.sparse.csr_matrix
+        Number of events every two cues occur in together.
+    cue_outcome - scipy.sparse.csr_matrix
+        Number of events every cue occurs in with every outcome.
+    cues, outcomes - list of str
+        Labels of the rows and columns.
+    """
+    cue_ids = {}
+    outcome_ids = {}
+    cue_cue = sparse.csr_matrix((0, 0))
+    cue_outcome = sparse.csr_matrix((0, 0))
+
+    for chunk in tqdm(read_event_chunks(events, chunksize=chunksize)):
+        rows, cue_columns, outcome_rows, outcome_columns = [], [], [], []
+        for event, (cues, outcomes) in enumerate(zip(chunk["cues"], chunk["outcomes"])):
+            # dict.fromkeys drops duplicates but keeps the order, so the IDs are reproducible.
+            event_cues = intern(dict.fromkeys(filter(None, cues.split("_"))), cue_ids)
+            event_outcomes = intern(
+                dict.fromkeys(filter(None, outcomes.split("_"))), outcome_ids
+            )
+            rows.extend([event] * len(event_cues))
+            cue_columns.extend(event_cues)
+            outcome_rows.extend([event] * len(event_outcomes))
+            outcome_columns.extend(event_outcomes)
+
+        # Event x cue and event x outcome incidence matrices of the chunk.
+        shape = (len(chunk), len(cue_ids))
+        cue_incidence = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cue_columns)), shape=shape
+        )
+        outcome_incidence = sparse.csr_matrix(
+            (np.ones(len(outcome_rows)), (outcome_rows, outcome_columns)),
+            shape=(len(chunk), len(outcome_ids)),
+        )
+
+        cue_cue = (
+            grow(cue_cue, (len(cue_ids), len(cue_ids)))
+            + cue_incidence.T @ cue_incidence
+        )
+        cue_outcome = (
+            grow(cue_outcome, (len(cue_ids), len(outcome_ids)))
+            + cue_incidence.T @ outcome_incidence
+        )
+
+    return cue_cue.tocsr(), cue_outcome.tocsr(), list(cue_ids), list(outcome_ids)
+
+
+def equilibrium_weights(
+    cue_cue,
+    cue_outcome,
+    cues,
+    outcomes,
+    lambda_=1.0,
+    ridge=RIDGE,
+    solver="sparse",
+    block_size=1024,
+) -> xr.DataArray:
+    """Solves C V = lambda O for the outcome x cue equilibrium weights.
+
+    Input:
+    -----
+    cue_cue, cue_outcome, cues, outcomes
+        As returned by cooccurrence_counts.
+    lambda_ - float
+        Maximal activation of an outcome.
+    ridge - float
+        Added to the diagonal of C, makes a singular C solvable.
+    solver - str
+        "sparse" factorizes C with a sparse LU decomposition, "dense" multiplies with the
+        pseudo-inverse of C, which also works for singular C but needs C in memory as a dense
+        matrix. If the sparse factorization fails because C is singular, the dense solver is
+        used instead.
+    block_size - int
+        Number of outcomes solved for at a time.
+    """
+    cue_cue = cue_cue + ridge * sparse.identity(cue_cue.shape[0], format="csr")
+    cue_outcome = sparse.csc_matrix(cue_outcome * lambda_)
+    weights = np.zeros((len(outcomes), len(cues)))
+
+    if solver not in ("sparse", "dense"):
+        raise ValueError("Unknown solver {}.".format(solver))
+    if solver == "sparse":
+        try:
+            solve = sparse_linalg.splu(sparse.csc_matrix(cue_cue)).solve
+        except RuntimeError:
+            print("The cue co-occurrence matrix is singular, using its pseudo-inverse.")
+            solver = "dense"
+    if solver == "dense":
+        inverse = scipy.linalg.pinvh(cue_cue.toarray())
+        solve = inverse.__matmul__
+
+    for start in tqdm(range(0, len(outcomes), block_size)):
+        block = cue_outcome[:, start : start + block_size].toarray()
+        weights[start : start + block_size] = solve(block).T
+
+    return xr.DataArray(
+        weights,
+        coords={"outcomes": outcomes, "cues": cues},
+        dims=("outcomes", "cues"),
+        attrs={
+            "engine": "equilibrium",
+            "lambda": lambda_,
+            "ridge": ridge,
+            "solver": solver,
+        },
+    )
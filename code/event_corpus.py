@@ -0,0 +1,244 @@
+"""Binary, integer-encoded event corpus.
+
+The events of an event file are stored with integer IDs instead of underscore-joined strings: a
+cue vocabulary with the domain of every cue, an outcome vocabulary, and the events as CSR arrays,
+    indptr - the cues of event i are event_cues[indptr[i] : indptr[i + 1]]
+    event_cues - cue IDs, in the order and with the duplicates of the cue strings
+    event_outcomes - the outcome ID of every event
+The corpus is saved as a directory of .npy arrays and vocabulary files next to the event file, e.g.
+../data/final_eventfile_buckeye.corpus/, and memory-mapped on load, so the indexing (event_index.py)
+and validation (event_validation.py) stages work on integer arrays instead of splitting the cue
+strings again. While the corpus is built, the arrays of every chunk of events are appended to
+files in that directory, so only the vocabularies are held in memory. Since the cue order and
+duplicates are kept, the corpus converts back to exactly the gzipped event file pyndl reads.
+
+Usage:
+    python event_corpus.py [--events ../data/final_eventfile_buckeye.gz]
+    python event_corpus.py --to-events ../data/final_eventfile_buckeye.roundtrip.gz
+"""
+
+import argparse
+import gzip
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from tqdm import tqdm
+
+from event_index import cue_domain, read_vocabulary, write_vocabulary
+from event_stream import read_event_chunks
+
+
+def corpus_path(event_file) -> str:
+    """Returns the directory the corpus of an event file is saved in."""
+    root, extension = os.path.splitext(event_file)
+    return root + ".corpus"
+
+
+class CorpusBuilder:
+    """Encodes events chunk by chunk, e.g. as the on_chunk function of merge_event_files, into an
+    EventCorpus saved at path. The integer arrays of every chunk are appended to files on disk, so
+    only the cue and outcome vocabularies are held in memory.
+
+    Input:
+    -----
+    path - str
+        Directory the corpus is saved in.
+    block_size - int
+        Number of array entries copied at a time when the corpus is finished.
+    """
+
+    dtypes = {"indptr": np.int64, "event_cues": np.int32, "event_outcomes": np.int32}
+
+    def __init__(self, path, block_size=1 << 24):
+        self.path = path
+        self.block_size = block_size
+        self.cue_ids = {}
+        self.outcome_ids = {}
+        self.n_cues = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {
+            name: open(os.path.join(path, name + ".bin"), "wb") for name in self.dtypes
+        }
+        self.files["indptr"].write(np.zeros(1, np.int64).tobytes())
+
+    def __call__(self, chunk):
+        """Adds a DataFrame of events with cues and outcomes columns."""
+        cue_lists = chunk["cues"].astype(str).str.split("_")
+        lengths = cue_lists.str.len().to_numpy(dtype=np.int64)
+        indptr = self.n_cues + np.cumsum(lengths)
+        self.n_cues += int(lengths.sum())
+        cues = itertools.chain.from_iterable(cue_lists)
+        event_cues = np.fromiter(
+            (self.cue_ids.setdefault(cue, len(self.cue_ids)) for cue in cues),
+            dtype=np.int32,
+        )
+        event_outcomes = np.fromiter(
+            (
+                self.outcome_ids.setdefault(outcome, len(self.outcome_ids))
+                for outcome in chunk["outcomes"].astype(str)
+            ),
+            dtype=np.int32,
+            count=len(chunk),
+        )
+        self.files["indptr"].write(indptr.tobytes())
+        self.files["event_cues"].write(event_cues.tobytes())
+        self.files["event_outcomes"].write(event_outcomes.tobytes())
+
+    def finish(self):
+        """Saves the corpus of all events added so far and returns it, memory-mapped."""
+        cues = list(self.cue_ids)
+        write_vocabulary(os.path.join(self.path, "cues.txt"), cues)
+        write_vocabulary(
+            os.path.join(self.path, "outcomes.txt"), list(self.outcome_ids)
+        )
+        np.save(
+            os.path.join(self.path, "cue_domains.npy"),
+            np.array([cue_domain(cue) for cue in cues], dtype=np.int8),
+        )
+
+        # Copy the appended arrays block by block into .npy files.
+        for name, file in self.files.items():
+            file.close()
+            raw = os.path.join(self.path, name + ".bin")
+            dtype = np.dtype(self.dtypes[name])
+            length = os.path.getsize(raw) // dtype.itemsize
+            target = np.lib.format.open_memmap(
+                os.path.join(self.path, name + ".npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(length,),
+            )
+            with open(raw, "rb") as f:
+                for start in range(0, length, self.block_size):
+                    block = np.fromfile(f, dtype=dtype, count=self.block_size)
+                    target[start : start + len(block)] = block
+            target.flush()
+            del target
+            os.remove(raw)
+        return EventCorpus.load(self.path)
+
+
+class EventCorpus:
+    """The events of an event file as integer CSR arrays with cue and outcome vocabularies."""
+
+    arrays = ("cue_domains", "indptr", "event_cues", "event_outcomes")
+
+    def __init__(self, cues, outcomes, **arrays):
+        self.cues = list(cues)
+        self.outcomes = list(outcomes)
+        self.cue_ids = {cue: index for index, cue in enumerate(self.cues)}
+        self.outcome_ids = {
+            outcome: index for index, outcome in enumerate(self.outcomes)
+        }
+        for name in self.arrays:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, event_files, path, chunksize=100000):
+        """Encodes a list of event files (paths or DataFrames with the columns 'cues' and
+        'outcomes'), in the order the events were learned, into a corpus saved at path.
+        """
+        builder = CorpusBuilder(path)
+        for file in event_files:
+            if isinstance(file, pd.DataFrame):
+                builder(file)
+            else:
+                for chunk in tqdm(read_event_chunks(file, chunksize=chunksize)):
+                    builder(chunk)
+        return builder.finish()
+
+    def save(self, path):
+        """Saves the corpus as a directory of .npy arrays and vocabulary files. Corpora built from
+        event files are saved while they are built, see CorpusBuilder."""
+        os.makedirs(path, exist_ok=True)
+        write_vocabulary(os.path.join(path, "cues.txt"), self.cues)
+        write_vocabulary(os.path.join(path, "outcomes.txt"), self.outcomes)
+        for name in self.arrays:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a corpus saved with save, memory-mapping its arrays."""
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+            for name in cls.arrays
+        }
+        return cls(
+            read_vocabulary(os.path.join(path, "cues.txt")),
+            read_vocabulary(os.path.join(path, "outcomes.txt")),
+            **arrays,
+        )
+
+    def __len__(self):
+        return len(self.event_outcomes)
+
+    def incidence(self) -> sparse.csr_matrix:
+        """Returns the binary event x cue matrix, with duplicate cues of an event counted once."""
+        matrix = sparse.csr_matrix(
+            (
+                np.ones(len(self.event_cues), dtype=np.int8),
+                # Copies, as sorting the indices would write to the memory-mapped arrays.
+                np.array(self.event_cues),
+                np.array(self.indptr),
+            ),
+            shape=(len(self), len(self.cues)),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def frame(self, start=0, stop=None) -> pd.DataFrame:
+        """Returns the events from start to stop as cue and outcome strings."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        indptr = self.indptr[start : stop + 1]
+        cues = self.event_cues[indptr[0] : indptr[-1]]
+        bounds = indptr - indptr[0]
+        return pd.DataFrame(
+            {
+                "cues": [
+                    "_".join(self.cues[cue] for cue in cues[begin:end])
+                    for begin, end in zip(bounds[:-1], bounds[1:])
+                ],
+                "outcomes": [
+                    self.outcomes[outcome]
+                    for outcome in self.event_outcomes[start:stop]
+                ],
+            }
+        )
+
+    def chunks(self, chunksize=100000):
+        """Yields the events as DataFrames of chunksize events of cue and outcome strings."""
+        for start in range(0, len(self), chunksize):
+            yield self.frame(start, start + chunksize)
+
+    def to_event_file(self, path, compresslevel=9, chunksize=100000):
+        """Writes the events as the gzipped, tab-separated event file pyndl reads."""
+        with gzip.open(
+            path + ".tmp",
+            "wt",
+            compresslevel=compresslevel,
+            encoding="utf-8",
+            newline="",
+        ) as f:
+            f.write("cues\toutcomes\n")
+            for chunk in self.chunks(chunksize):
+                chunk.to_csv(f, sep="\t", header=False, index=False)
+        os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", default="../data/final_eventfile_buckeye.gz")
+    parser.add_argument(
+        "--to-events", help="Write the corpus of --events back as a gzipped event file."
+    )
+    args = parser.parse_args()
+
+    if args.to_events:
+        EventCorpus.load(corpus_path(args.events)).to_event_file(args.to_events)
+    else:
+        EventCorpus.build([args.events], corpus_path(args.events))
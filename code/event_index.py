@@ -0,0 +1,313 @@
+"""Outcome -> cue inverted index of an event file.
+
+The index is built once from the event file and saved as a directory of .npy arrays next to it,
+e.g. ../data/final_eventfile_buckeye.index/. On load the arrays are memory-mapped, so looking up the
+predicting cues of an outcome, or the outcomes a cue occurs with, is a slice instead of a scan
+over all events.
+
+Cues and outcomes are stored as integer IDs into cues.txt and outcomes.txt. For every outcome the
+index holds the cues of its first event and the union of the cues of all its events, both sorted by
+domain so each domain is a contiguous slice. For every cue it holds the outcomes it occurs with and
+how many events they share.
+
+The index is built from the binary corpus of the event file (see event_corpus.py) if there is one,
+otherwise from the event file itself. The size and modification time of the event file are saved
+with the index, so it is only rebuilt when the event file changes.
+
+Usage:
+    python event_index.py
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from event_stream import read_event_chunks
+
+# Domain codes of the cues, in the order they are stored within each outcome.
+OTHER, SEGMENT, SYLLABLE, CONTEXT = range(4)
+DOMAIN_PREFIXES = {SEGMENT: "s.", SYLLABLE: "y.", CONTEXT: "c."}
+DOMAIN_NAMES = {SEGMENT: "Segment", SYLLABLE: "Syllable", CONTEXT: "Context"}
+
+
+def cue_domain(cue) -> int:
+    """Returns the domain code of a cue."""
+    for domain, prefix in DOMAIN_PREFIXES.items():
+        if cue.startswith(prefix):
+            return domain
+    return OTHER
+
+
+def index_path(event_file) -> str:
+    """Returns the directory the index of an event file is saved in."""
+    root, extension = os.path.splitext(event_file)
+    return root + ".index"
+
+
+def source_stamp(event_file) -> dict:
+    """Returns the size and modification time of an event file, saved with its index."""
+    status = os.stat(event_file)
+    return {"size": status.st_size, "mtime_ns": status.st_mtime_ns}
+
+
+def is_current(path, event_file) -> bool:
+    """Returns whether the index saved at path was built from the event file as it is now."""
+    stamp = os.path.join(path, "source.json")
+    if not os.path.exists(stamp):
+        return False
+    with open(stamp) as f:
+        return json.load(f) == source_stamp(event_file)
+
+
+def read_vocabulary(path) -> list:
+    """Reads a vocabulary of one entry per line. Entries are only split on "\n", so an empty
+    vocabulary reads back empty and an empty cue stays an entry."""
+    with open(path, encoding="utf-8", newline="\n") as f:
+        return [line[:-1] if line.endswith("\n") else line for line in f]
+
+
+def write_vocabulary(path, vocabulary):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.writelines(entry + "\n" for entry in vocabulary)
+
+
+def domain_sorted_csr(rows, columns, domains, n_rows):
+    """Sorts (row, column) pairs by row, domain and column and returns the CSR arrays
+    (indptr, columns) plus a n_rows x 5 array of offsets of each domain within each row.
+    """
+    order = np.lexsort((columns, domains, rows))
+    rows = rows[order]
+    columns = columns[order]
+    domains = domains[order]
+
+    domain_indptr = np.zeros((n_rows, len(DOMAIN_NAMES) + 2), dtype=np.int64)
+    counts = np.zeros((n_rows, len(DOMAIN_NAMES) + 1), dtype=np.int64)
+    np.add.at(counts, (rows, domains), 1)
+    domain_indptr[:, 1:] = np.cumsum(counts, axis=1)
+    indptr = np.concatenate([[0], np.cumsum(domain_indptr[:, -1])])
+    domain_indptr += indptr[:-1, None]
+
+    return indptr, columns.astype(np.int32), domain_indptr
+
+
+class OutcomeIndex:
+    """Inverted index from outcomes to their predicting cues, built from an event file."""
+
+    arrays = (
+        "cue_domains",
+        "first_domain_indptr",
+        "first_cues",
+        "union_domain_indptr",
+        "union_cues",
+        "cue_indptr",
+        "cue_outcomes",
+        "cue_outcome_counts",
+    )
+
+    def __init__(self, cues, outcomes, **arrays):
+        self.cues = list(cues)
+        self.outcomes = list(outcomes)
+        self.cue_ids = {cue: index for index, cue in enumerate(self.cues)}
+        self.outcome_ids = {
+            outcome: index for index, outcome in enumerate(self.outcomes)
+        }
+        for name in self.arrays:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, event_files, chunksize=100000):
+        """Build the index from a list of event files (paths or DataFrames with the columns
+        'cues' and 'outcomes'), in the order the events were learned."""
+        cue_ids = {}
+        outcome_ids = {}
+        first_seen = set()
+        first_rows, first_columns = [], []
+        pairs = {}
+
+        def add_events(events):
+            for cues, outcome in zip(events["cues"], events["outcomes"]):
+                outcome = outcome_ids.setdefault(str(outcome), len(outcome_ids))
+                ids = {
+                    cue_ids.setdefault(cue, len(cue_ids))
+                    for cue in str(cues).split("_")
+                }
+                if outcome not in first_seen:
+                    first_seen.add(outcome)
+                    first_rows.extend([outcome] * len(ids))
+                    first_columns.extend(ids)
+                for cue in ids:
+                    pairs[(cue, outcome)] = pairs.get((cue, outcome), 0) + 1
+
+        for file in event_files:
+            if isinstance(file, pd.DataFrame):
+                add_events(file)
+            else:
+                for chunk in tqdm(read_event_chunks(file, chunksize=chunksize)):
+                    add_events(chunk)
+
+        cues = list(cue_ids)
+        return cls.from_pairs(
+            cues,
+            list(outcome_ids),
+            np.array([cue_domain(cue) for cue in cues], dtype=np.int8),
+            np.array(first_rows, dtype=np.int64),
+            np.array(first_columns, dtype=np.int64),
+            np.fromiter((cue for cue, _ in pairs), dtype=np.int64, count=len(pairs)),
+            np.fromiter(
+                (outcome for _, outcome in pairs), dtype=np.int64, count=len(pairs)
+            ),
+            np.fromiter(pairs.values(), dtype=np.int64, count=len(pairs)),
+        )
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """Build the index from an EventCorpus (see event_corpus.py) without parsing cue strings."""
+        incidence = corpus.incidence().tocoo()
+        event_outcomes = np.asarray(corpus.event_outcomes, dtype=np.int64)
+        rows = event_outcomes[incidence.row]
+        columns = incidence.col.astype(np.int64)
+
+        # The first event of every outcome.
+        first_event = np.zeros(len(corpus.outcomes), dtype=np.int64)
+        outcomes, first = np.unique(event_outcomes, return_index=True)
+        first_event[outcomes] = first
+        is_first = first_event[rows] == incidence.row
+
+        # Count the events of every (cue, outcome) pair.
+        n_outcomes = len(corpus.outcomes)
+        pairs, pair_counts = np.unique(columns * n_outcomes + rows, return_counts=True)
+
+        return cls.from_pairs(
+            corpus.cues,
+            corpus.outcomes,
+            np.asarray(corpus.cue_domains),
+            rows[is_first],
+            columns[is_first],
+            pairs // n_outcomes,
+            pairs % n_outcomes,
+            pair_counts,
+        )
+
+    @classmethod
+    def from_pairs(
+        cls,
+        cues,
+        outcomes,
+        cue_domains,
+        first_rows,
+        first_columns,
+        pair_cues,
+        pair_outcomes,
+        pair_counts,
+    ):
+        """Build the index from the (outcome, cue) pairs of the first events of the outcomes and
+        the (cue, outcome) pairs of all events with the number of events they occur in.
+        """
+        _, first_cues, first_domain_indptr = domain_sorted_csr(
+            first_rows, first_columns, cue_domains[first_columns], len(outcomes)
+        )
+        _, union_cues, union_domain_indptr = domain_sorted_csr(
+            pair_outcomes, pair_cues, cue_domains[pair_cues], len(outcomes)
+        )
+
+        order = np.lexsort((pair_outcomes, pair_cues))
+        cue_indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(pair_cues, minlength=len(cues)))]
+        )
+
+        return cls(
+            cues,
+            outcomes,
+            cue_domains=cue_domains,
+            first_domain_indptr=first_domain_indptr,
+            first_cues=first_cues,
+            union_domain_indptr=union_domain_indptr,
+            union_cues=union_cues,
+            cue_indptr=cue_indptr,
+            cue_outcomes=pair_outcomes[order].astype(np.int32),
+            cue_outcome_counts=pair_counts[order],
+        )
+
+    def save(self, path, event_file=None):
+        """Saves the index as a directory of .npy arrays and vocabulary files. With the event file
+        it was built from, its stamp is written last, see is_current."""
+        os.makedirs(path, exist_ok=True)
+        stamp = os.path.join(path, "source.json")
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        write_vocabulary(os.path.join(path, "cues.txt"), self.cues)
+        write_vocabulary(os.path.join(path, "outcomes.txt"), self.outcomes)
+        for name in self.arrays:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        if event_file is not None:
+            with open(stamp, "w") as f:
+                json.dump(source_stamp(event_file), f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads an index saved with save, memory-mapping its arrays."""
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+            for name in cls.arrays
+        }
+        return cls(
+            read_vocabulary(os.path.join(path, "cues.txt")),
+            read_vocabulary(os.path.join(path, "outcomes.txt")),
+            **arrays,
+        )
+
+    def cue_slice(self, outcome, first=False, domain=None) -> np.ndarray:
+        """Returns the IDs of the cues of an outcome, either of its first event or of all its
+        events, optionally only those of one domain."""
+        outcome = self.outcome_ids[outcome]
+        if first:
+            domain_indptr, ids = self.first_domain_indptr, self.first_cues
+        else:
+            domain_indptr, ids = self.union_domain_indptr, self.union_cues
+        if domain is None:
+            return ids[domain_indptr[outcome, 0] : domain_indptr[outcome, -1]]
+        return ids[domain_indptr[outcome, domain] : domain_indptr[outcome, domain + 1]]
+
+    def predicting_cues(self, outcome, per_domain=False, no_context=False):
+        """Same output as get_all_predicting_cues in variablesOtherPrior.py."""
+        if outcome not in self.outcome_ids:
+            return {} if per_domain else []
+        if no_context:
+            ids = np.concatenate(
+                [
+                    self.cue_slice(outcome, first=True, domain=SEGMENT),
+                    self.cue_slice(outcome, first=True, domain=SYLLABLE),
+                ]
+            )
+            return [self.cues[cue] for cue in ids]
+        if per_domain:
+            return {
+                name
+                + " cues: ": [
+                    self.cues[cue] for cue in self.cue_slice(outcome, domain=domain)
+                ]
+                for domain, name in DOMAIN_NAMES.items()
+            }
+        return [self.cues[cue] for cue in self.cue_slice(outcome)]
+
+    def cue_events(self, cue):
+        """Returns the outcomes a cue occurs with and the number of events they share."""
+        cue = self.cue_ids[cue]
+        start, end = self.cue_indptr[cue], self.cue_indptr[cue + 1]
+        outcomes = [self.outcomes[outcome] for outcome in self.cue_outcomes[start:end]]
+        return outcomes, self.cue_outcome_counts[start:end]
+
+
+if __name__ == "__main__":
+    from event_corpus import EventCorpus, corpus_path
+
+    event_file = "../data/final_eventfile_buckeye.gz"
+    if os.path.isdir(corpus_path(event_file)):
+        index = OutcomeIndex.from_corpus(EventCorpus.load(corpus_path(event_file)))
+    else:
+        index = OutcomeIndex.build([event_file])
+    index.save(index_path(event_file), event_file)
@@ -0,0 +1,151 @@
+"""Streaming reading and writing of event files.
+
+Per-speaker event files are read in chunks and written straight into the gzipped, tab-separated
+cues/outcomes format pyndl reads, so neither a full-corpus DataFrame nor an uncompressed copy of
+the merged event file is ever created.
+
+An EventSink collects the events of every speaker and writes each speaker's event file in chunks,
+appending to it, so every event is written once. When it is closed, it lists the files it wrote in
+the manifest speakers.json in the same directory, which speaker_event_files reads, so files left
+over from earlier runs are never merged.
+
+Usage:
+    from event_stream import EventSink, merge_event_files, speaker_event_files
+
+    with EventSink("../data/updated_eventfiles/") as sink:
+        sink.add(speaker, events)
+    merge_event_files(speaker_event_files(), "../data/final_eventfile_buckeye.gz", compresslevel=6)
+"""
+
+import gzip
+import json
+import os
+
+import pandas as pd
+
+SPEAKER_EVENTS = "../data/updated_eventfiles/"
+MANIFEST = "speakers.json"
+
+
+class EventSink:
+    """Buffers the events of every speaker and writes them to the tab-separated event file
+    <directory>/<speaker>.tsv, with the index column eventfilesV1.py always wrote.
+
+    Input:
+    -----
+    directory - str
+        Directory of the speaker event files.
+    chunksize - int
+        Number of buffered events of a speaker at which they are appended to its file.
+    """
+
+    def __init__(self, directory=SPEAKER_EVENTS, chunksize=100000):
+        self.directory = directory
+        self.chunksize = chunksize
+        self.buffers = {}
+        self.buffered = {}
+        self.written = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, speaker) -> str:
+        return os.path.join(self.directory, str(speaker) + ".tsv")
+
+    def add(self, speaker, events):
+        """Adds a DataFrame of events with cues and outcomes columns to a speaker."""
+        self.buffers.setdefault(speaker, []).append(events[["cues", "outcomes"]])
+        self.buffered[speaker] = self.buffered.get(speaker, 0) + len(events)
+        if self.buffered[speaker] >= self.chunksize:
+            self.flush(speaker)
+
+    def flush(self, speaker):
+        """Appends the buffered events of a speaker to its file, which is started anew on the
+        first write."""
+        buffer = self.buffers.pop(speaker, None)
+        self.buffered.pop(speaker, None)
+        if buffer is None:
+            return
+        events = pd.concat(buffer, ignore_index=True)
+
+        # The index continues over the chunks, as if the file had been written at once.
+        first = speaker not in self.written
+        events.index += self.written.get(speaker, 0)
+        events.to_csv(
+            self.path(speaker), sep="\t", mode="w" if first else "a", header=first
+        )
+        self.written[speaker] = self.written.get(speaker, 0) + len(events)
+
+    def close(self) -> list:
+        """Writes all buffered events and the manifest, and returns the paths of the speaker
+        files, sorted."""
+        for speaker in list(self.buffers):
+            self.flush(speaker)
+        paths = sorted(self.path(speaker) for speaker in self.written)
+        manifest = os.path.join(self.directory, MANIFEST)
+        with open(manifest + ".tmp", "w") as f:
+            json.dump([os.path.basename(path) for path in paths], f, indent=2)
+        os.replace(manifest + ".tmp", manifest)
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def speaker_event_files(directory=SPEAKER_EVENTS) -> list:
+    """Returns the speaker event files an EventSink wrote to a directory, sorted by speaker."""
+    manifest = os.path.join(directory, MANIFEST)
+    if not os.path.exists(manifest):
+        raise FileNotFoundError(
+            "{} has no manifest {}, write the speaker event files with eventfilesV1.py.".format(
+                directory, MANIFEST
+            )
+        )
+    with open(manifest) as f:
+        return [os.path.join(directory, name) for name in json.load(f)]
+
+
+def read_event_chunks(path, chunksize=100000):
+    """Yields the cues and outcomes of an event file in DataFrames of chunksize events.
+    Index columns left over from DataFrame.to_csv are dropped."""
+    reader = pd.read_csv(
+        path,
+        sep="\t",
+        usecols=["cues", "outcomes"],
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunksize,
+        engine="c",
+    )
+    for chunk in reader:
+        yield chunk[["cues", "outcomes"]]
+
+
+def merge_event_files(paths, output, compresslevel=9, chunksize=100000, on_chunk=None):
+    """Concatenates event files, in the given order, into one gzipped event file.
+
+    Input:
+    -----
+    paths - list of str
+        The event files to merge.
+    output - str
+        Path of the gzipped event file.
+    compresslevel - int
+        gzip compression level, from 1 (fastest) to 9 (smallest).
+    chunksize - int
+        Number of events held in memory at a time.
+    on_chunk - callable
+        Optional function that is called with every chunk of events, e.g. to validate them.
+    """
+    # Write to a temporary file, so an interrupted merge never leaves a truncated event file.
+    with gzip.open(
+        output + ".tmp", "wt", compresslevel=compresslevel, encoding="utf-8", newline=""
+    ) as f:
+        f.write("cues\toutcomes\n")
+        for path in paths:
+            for chunk in read_event_chunks(path, chunksize=chunksize):
+                if on_chunk is not None:
+                    on_chunk(chunk)
+                chunk.to_csv(f, sep="\t", header=False, index=False)
+    os.replace(output + ".tmp", output)
@@ -0,0 +1,154 @@
+"""Validation of an event file while it is streamed.
+
+An EventValidator is called with every chunk of events, e.g. as the on_chunk function of
+merge_event_files, and collects the outcome and cue types in hash sets on the way. Its report
+checks that a list of words are all outcomes in linear time and lists the problems that are left
+over from building the cue strings:
+    missing_outcomes - required words that are no outcome of any event
+    empty_cue_strings - events without any cues
+    empty_cues - events with an empty cue, i.e. a doubled, leading or trailing "_"
+    na_artifacts - cues that are only a domain prefix or an "NA" or "nan" left over from a missing
+                   value, with the number of events they occur in
+    domains - number of cue types per domain and how often they occur, counted once per event
+
+An EventCorpus (see event_corpus.py) is validated on its integer arrays with add_corpus instead.
+
+Usage:
+    from event_validation import EventValidator
+
+    validator = EventValidator()
+    merge_event_files(paths, output, on_chunk=validator)
+    # or: validator.add_corpus(EventCorpus.load(corpus_path(output)))
+    write_report("../data/final_eventfile_buckeye.validation.json", validator.report(words))
+"""
+
+import json
+from collections import Counter
+
+import numpy as np
+
+from event_index import DOMAIN_NAMES, DOMAIN_PREFIXES, OTHER, cue_domain
+
+NA_VALUES = {"NA", "nan"}
+
+
+def is_na_artifact(cue) -> bool:
+    """Returns whether a cue is a bare domain prefix or a missing value."""
+    domain = cue_domain(cue)
+    body = cue if domain == OTHER else cue[len(DOMAIN_PREFIXES[domain]) :]
+    return body == "" or body in NA_VALUES
+
+
+class EventValidator:
+    """Collects the outcome and cue types and the cue string problems of an event file.
+
+    Input:
+    -----
+    max_examples - int
+        Number of example events kept for every kind of problem.
+    """
+
+    def __init__(self, max_examples=10):
+        self.max_examples = max_examples
+        self.n_events = 0
+        self.outcomes = set()
+        self.cue_counts = Counter()
+        self.empty_cue_strings = 0
+        self.empty_cues = 0
+        self.examples = {"empty_cue_strings": [], "empty_cues": []}
+
+    def _add_examples(self, kind, events):
+        free = self.max_examples - len(self.examples[kind])
+        if free > 0:
+            self.examples[kind].extend(events[:free].to_dict("records"))
+
+    def __call__(self, chunk):
+        """Adds a DataFrame of events with cues and outcomes columns."""
+        self.n_events += len(chunk)
+        self.outcomes.update(chunk["outcomes"].unique())
+
+        empty = chunk["cues"] == ""
+        self.empty_cue_strings += int(empty.sum())
+        self._add_examples("empty_cue_strings", chunk[empty])
+
+        cues = chunk.loc[~empty, "cues"]
+        broken = (
+            cues.str.contains("__", regex=False)
+            | cues.str.startswith("_")
+            | cues.str.endswith("_")
+        )
+        self.empty_cues += int(broken.sum())
+        self._add_examples("empty_cues", chunk.loc[broken[broken].index])
+
+        # Count every cue type once per event, as pyndl removes duplicate cues of an event.
+        cue_types = cues.str.split("_").map(set).explode()
+        self.cue_counts.update(cue_types[cue_types != ""].value_counts().to_dict())
+
+    def add_corpus(self, corpus):
+        """Adds all events of an EventCorpus, working on its cue and outcome IDs."""
+        n_events = len(corpus)
+        self.n_events += n_events
+        event_outcomes = np.asarray(corpus.event_outcomes)
+        self.outcomes.update(
+            corpus.outcomes[outcome] for outcome in np.unique(event_outcomes)
+        )
+
+        # An empty cue string is a single empty cue, a doubled or outer "_" adds an empty cue.
+        empty_cue = corpus.cue_ids.get("")
+        if empty_cue is not None:
+            indptr = np.asarray(corpus.indptr)
+            event_cues = np.asarray(corpus.event_cues)
+            events = np.repeat(np.arange(n_events), np.diff(indptr))
+            has_empty = (
+                np.bincount(events[event_cues == empty_cue], minlength=n_events) > 0
+            )
+            empty = has_empty & (np.diff(indptr) == 1)
+            broken = has_empty & ~empty
+            self.empty_cue_strings += int(empty.sum())
+            self.empty_cues += int(broken.sum())
+            for kind, mask in (("empty_cue_strings", empty), ("empty_cues", broken)):
+                free = self.max_examples - len(self.examples[kind])
+                for event in np.flatnonzero(mask)[: max(free, 0)]:
+                    self._add_examples(kind, corpus.frame(event, event + 1))
+
+        # Count every cue type once per event, as pyndl removes duplicate cues of an event.
+        counts = np.asarray(corpus.incidence().sum(axis=0)).ravel()
+        self.cue_counts.update(
+            {
+                corpus.cues[cue]: int(counts[cue])
+                for cue in np.flatnonzero(counts)
+                if corpus.cues[cue] != ""
+            }
+        )
+
+    def report(self, required_outcomes=()) -> dict:
+        """Returns the validation report, checking that all required outcomes occur."""
+        missing = sorted(set(required_outcomes) - self.outcomes)
+
+        na_artifacts = {
+            cue: count for cue, count in self.cue_counts.items() if is_na_artifact(cue)
+        }
+
+        domains = {name: {"types": 0, "tokens": 0} for name in DOMAIN_NAMES.values()}
+        domains["Other"] = {"types": 0, "tokens": 0}
+        for cue, count in self.cue_counts.items():
+            name = DOMAIN_NAMES.get(cue_domain(cue), "Other")
+            domains[name]["types"] += 1
+            domains[name]["tokens"] += count
+
+        return {
+            "n_events": self.n_events,
+            "n_outcomes": len(self.outcomes),
+            "n_cues": len(self.cue_counts),
+            "missing_outcomes": missing,
+            "empty_cue_strings": self.empty_cue_strings,
+            "empty_cues": self.empty_cues,
+            "na_artifacts": dict(sorted(na_artifacts.items())),
+            "domains": domains,
+            "examples": self.examples,
+        }
+
+
+def write_report(path, report):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
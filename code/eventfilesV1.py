@@ -1,34 +1,34 @@
 """Formats the trianing data into eventfile format.
 The eventfile format is a tab-separated file with two columns: cues and outcomes.
 The cues column contains the context, syllables, and segments of a word.
-The outcomes column contains the word itself.  
+The outcomes column contains the word itself.
 
-NOTE: This script requires download of the en_us_cmudict_forward.pt file. THe syllabifier code is an early version of the syllabifier by Kyle Gorman.
+One event per word token of the token table, fillers included. The speaker event files are
+written to ../data/updated_eventfiles/, the context options to ../data/context.json and the
+syllable and segment cues of every word type to ../data/word_cues.tsv.
+
+NOTE: This script requires download of the en_us_cmudict_forward.pt file. The syllabifier lives in
+syllabifier.py.
 
 Usage:
-    python eventfilesV1.py
+    python eventfilesV1.py [--context-window 1] [--context-bigrams]
+                           [--context-min-count 1] [--context-max-cues N] [--context-budget MB]
+                           [--context-buckets N]
 """
 
-import os
+import argparse
 import re
 from typing import LiteralString
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
-from dp.phonemizer import Phonemizer
-
 
-def get_context(index) -> list[str]:
-    """Returns the context of a word in a list of words."""
-    if index == 0:
-        context = "c." + words[index + 1]
-    elif index == len(words) - 1:
-        context = "c." + words[index - 1]
-    else:
-        previous_word = "c." + words[index - 1]
-        following_word = "c." + words[index + 1]
-        context = previous_word + "_" + following_word
-    return context
+from context_cues import ContextConfig, context_strings
+from event_stream import SPEAKER_EVENTS, EventSink
+from pronunciations import CachedPhonemizer
+from syllabifier import syllabify_pronunciation
+from token_table import load_tokens, word_tokens
+from word_cues import write_word_cues
 
 
 def get_segments(word, upper=False) -> str | list[str]:
@@ -67,281 +67,108 @@ def join_syllables(syllables) -> LiteralString:
     return syllables_joined
 
 
-def syllabify(language, word):
-    """Syllabifies the word, given a language configuration loaded with
-    loadLanguage. word is either a string of phonemes from the CMU
-    pronouncing dictionary set (with optional stress numbers after vowels),
-    or a Python list of phonemes, e.g. "B AE1 T" or ["B", "AE1", "T"]
-    """
-
-    if type(word) == str:
-        word = word.split()
-    # This is the returned data structure.
-    syllables = []
-
-    # This maintains a list of phonemes between nuclei.
-    internuclei = []
-
-    for phoneme in word:
-
-        phoneme = phoneme.strip()
-        if phoneme == "":
-            continue
-        stress = None
-        if phoneme[-1].isdigit():
-            stress = int(phoneme[-1])
-            phoneme = phoneme[0:-1]
-
-        # Split the consonants seen since the last nucleus into coda and
-        # onset.
-        if phoneme in language["vowels"]:
-
-            coda = None
-            onset = None
-
-            # If there is a period in the input, split there.
-            if "." in internuclei:
-                period = internuclei.index(".")
-                coda = internuclei[:period]
-                onset = internuclei[period + 1 :]
-
-            else:
-                # Make the largest onset we can. The 'split' variable marks
-                # the break point.
-                for split in range(0, len(internuclei) + 1):
-                    coda = internuclei[:split]
-                    onset = internuclei[split:]
-
-                    # If we are looking at a valid onset, or if we're at the
-                    # start of the word (in which case an invalid onset is
-                    # better than a coda that doesn't follow a nucleus), or
-                    # if we've gone through all of the onsets and we didn't
-                    # find any that are valid, then split the nonvowels
-                    # we've seen at this location.
-                    if (
-                        " ".join(onset) in language["onsets"]
-                        or len(syllables) == 0
-                        or len(onset) == 0
-                    ):
-                        break
-
-            # Tack the coda onto the coda of the last syllable. Can't do it
-            # if this is the first syllable.
-            if len(syllables) > 0:
-                syllables[-1][3].extend(coda)
-
-            # Make a new syllable out of the onset and nucleus.
-            syllables.append((stress, onset, [phoneme], []))
-
-            # At this point we've processed the internuclei list.
-            internuclei = []
-
-        elif not phoneme in language["consonants"] and phoneme != ".":
-            raise ValueError("Invalid phoneme: " + phoneme)
-
-        else:  # a consonant
-            internuclei.append(phoneme)
+def word_cue_block(word) -> str:
+    """Returns the syllable and segment cues of a word as one cue string."""
+    segments = join_segments(word)
+    raw_syllables = syllabify_pronunciation(
+        tuple(get_segments(word, upper=True).split())
+    )
+    syllables = join_syllables(raw_syllables)
+    return "_".join(part for part in (syllables.lower(), segments) if part)
 
-    # Done looping through phonemes. We may have consonants left at the end.
-    # We may have even not found a nucleus.
-    if len(internuclei) > 0:
-        if len(syllables) == 0:
-            syllables.append((None, internuclei, [], []))
-        else:
-            syllables[-1][3].extend(internuclei)
 
-    return syllables
-
-
-def stringify(syllables) -> LiteralString:
-    """This function takes a syllabification returned by syllabify and
-    turns it into a string, with phonemes spearated by spaces and
-    syllables spearated by periods."""
-    ret = []
-    for syl in syllables:
-        stress, onset, nucleus, coda = syl
-        if stress != None and len(nucleus) != 0:
-            nucleus[0] += str(stress)
-        ret.append("".join(onset + nucleus + coda))
-    return " ".join(ret)
+def word_cue_table(words) -> pd.DataFrame:
+    """Returns the word-internal cue string of every word type, indexed by word."""
+    return pd.DataFrame(
+        {"cues": [word_cue_block(word) for word in words]},
+        index=pd.Index(words, name="word"),
+    )
 
 
 if __name__ == "__main__":
-    phonemizer = Phonemizer.from_checkpoint("../data/en_us_cmudict_forward.pt")
-
-    # English language settings for the language parameter in the syllabifier.
-    English = {
-        "consonants": [
-            "B",
-            "CH",
-            "D",
-            "DH",
-            "F",
-            "G",
-            "HH",
-            "JH",
-            "K",
-            "L",
-            "M",
-            "N",
-            "NG",
-            "P",
-            "R",
-            "S",
-            "SH",
-            "T",
-            "TH",
-            "V",
-            "W",
-            "Y",
-            "Z",
-            "ZH",
-        ],
-        "vowels": [
-            "AA",
-            "AE",
-            "AH",
-            "AO",
-            "AW",
-            "AY",
-            "EH",
-            "ER",
-            "EY",
-            "IH",
-            "IY",
-            "OW",
-            "OY",
-            "UH",
-            "UW",
-        ],
-        "onsets": [
-            "P",
-            "T",
-            "K",
-            "B",
-            "D",
-            "G",
-            "F",
-            "V",
-            "TH",
-            "DH",
-            "S",
-            "Z",
-            "SH",
-            "CH",
-            "JH",
-            "M",
-            "N",
-            "R",
-            "L",
-            "HH",
-            "W",
-            "Y",
-            "P R",
-            "T R",
-            "K R",
-            "B R",
-            "D R",
-            "G R",
-            "F R",
-            "TH R",
-            "SH R",
-            "P L",
-            "K L",
-            "B L",
-            "G L",
-            "F L",
-            "S L",
-            "T W",
-            "K W",
-            "D W",
-            "S W",
-            "S P",
-            "S T",
-            "S K",
-            "S F",
-            "S M",
-            "S N",
-            "G W",
-            "SH W",
-            "S P R",
-            "S P L",
-            "S T R",
-            "S K R",
-            "S K W",
-            "S K L",
-            "TH W",
-            "ZH",
-            "P Y",
-            "K Y",
-            "B Y",
-            "F Y",
-            "HH Y",
-            "V Y",
-            "TH Y",
-            "M Y",
-            "S P Y",
-            "S K Y",
-            "G Y",
-            "HH W",
-            "",
-        ],
-    }
-    language = English
-
-    path = "../data/allwords_perspeaker_csv/"
-    files = os.listdir(path)
-
-    speakers = []
-    transcriptions = {}
-
-    for file in tqdm(files):
-        # List of words for the speaker
-        df = pd.read_csv(path + file)
-        words = df["token"].tolist()
-
-        # Create new dataframe for speaker.
-        df_name = file.replace(".csv", "")
-        df = pd.DataFrame({"cues": [], "outcomes": []})
-
-        for index, word in enumerate(words):
-
-            # Get context.
-            context = get_context(index, word)
-
-            # Get Segments.
-            if word not in transcriptions.keys():
-                segments = join_segments(word)
-                raw_segments = get_segments(word, upper=True)
-                transcriptions[word] = {
-                    "cue_segments": str(segments),
-                    "segments": str(raw_segments),
-                }
-            else:
-                segments = transcriptions[word]["cue_segments"]
-
-            # Get syllables.
-            raw_syllables = stringify(
-                syllabify(English, transcriptions[word]["segments"])
-            )
-            syllables = join_syllables(raw_syllables)
-
-            # Append all cue strings and clean track boundaries
-            cues = context + "_" + syllables.lower() + "_" + segments
-            if "NA_" in cues:
-                cues = cues.replace("NA", "")
-
-            # Append all information to the dataframe as a new row.
-            df.loc[len(df)] = {"cues": str(cues), "outcomes": str(word)}
-
-            # Save individual speaker dataframe.
-            df.to_csv(
-                "/gpfs/project/anste145/input_files/buckeye_data/event_files/"
-                + df_name
-                + ".tsv"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--context-window", type=int, default=1, help="Context words on either side."
+    )
+    parser.add_argument(
+        "--context-bigrams",
+        action="store_true",
+        help="Also use the two words before and after a word as context cues.",
+    )
+    parser.add_argument(
+        "--context-min-count",
+        type=int,
+        default=1,
+        help="Drop context cues seen with fewer tokens.",
+    )
+    parser.add_argument(
+        "--context-max-cues",
+        type=int,
+        help="Keep only the N most frequent context cues.",
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=float,
+        help="Keep only as many context cues as fit in this many MB of float64 weights, "
+        "together with the segment and syllable cues.",
+    )
+    parser.add_argument(
+        "--context-buckets", type=int, help="Hash the context cues into N buckets."
+    )
+    args = parser.parse_args()
+
+    tokens = word_tokens(
+        load_tokens(columns=["speaker", "track", "orthography", "is_pause"])
+    )
+
+    phonemizer = CachedPhonemizer("../data/en_us_cmudict_forward.pt")
+    phonemizer.preload()
+
+    # The word-internal cues only depend on the word type, so build them once per type.
+    orthography = tokens["orthography"].cat.remove_unused_categories()
+    table = word_cue_table(orthography.cat.categories)
+    write_word_cues(table)
+    internal = table["cues"].to_numpy(dtype=object)[orthography.cat.codes.to_numpy()]
+
+    # Every cue has one weight per outcome, i.e. per word type. The context cues get what is left
+    # of the budget after the segment and syllable cues.
+    max_cues = args.context_max_cues
+    if args.context_budget is not None:
+        n_outcomes = len(table)
+        n_internal = len(set(filter(None, "_".join(table["cues"]).split("_"))))
+        budget_cues = int(args.context_budget * 1e6 / (8 * n_outcomes)) - n_internal
+        if budget_cues <= 0:
+            parser.error(
+                "--context-budget {} MB does not even fit the weights of the {} segment and "
+                "syllable cues ({:.1f} MB).".format(
+                    args.context_budget, n_internal, n_internal * 8 * n_outcomes / 1e6
+                )
             )
-            speakers.append(df)
-
-    # Concat all individual speaker dataframes into one dataframe.
-    buckeye_event_file = pd.concat(speakers)
-    buckeye_event_file.to_csv("../data/buckeye_event_file.tsv", index=False)
+        max_cues = budget_cues if max_cues is None else min(max_cues, budget_cues)
+    config = ContextConfig(
+        window=args.context_window,
+        bigrams=args.context_bigrams,
+        min_count=args.context_min_count,
+        max_cues=max_cues,
+        buckets=args.context_buckets,
+    )
+    config.save()
+    context = context_strings(tokens, config).to_numpy(dtype=object)
+
+    # Per token only the context is added, a word alone in its track has no context.
+    both = (context != "") & (internal != "")
+    events = pd.DataFrame(
+        {
+            "cues": np.where(both, context + "_" + internal, context + internal),
+            "outcomes": orthography.astype(str).to_numpy(),
+        }
+    )
+
+    # Save the events of every speaker, named after the speaker so the merged event file keeps
+    # their order. Every speaker file is written once.
+    # The sink lists the files in a manifest, so only these are merged.
+    speakers = tokens["speaker"].astype(str).to_numpy()
+    with EventSink(SPEAKER_EVENTS) as sink:
+        for speaker, rows in events.groupby(speakers, sort=True):
+            sink.add(speaker, rows)
+    print(phonemizer.report())
@@ -0,0 +1,18 @@
+"""Content hashes of files.
+
+Usage:
+    from file_hash import file_sha256
+
+    file_sha256("../data/final_eventfile_buckeye.gz")
+"""
+
+import hashlib
+
+
+def file_sha256(path) -> str:
+    """Returns the sha256 hash of a file's content, read in blocks of 1 MB."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,43 @@
+"""Column-wise accumulator for building a DataFrame row by row.
+
+Appending with df.loc[len(df)] = {...} copies the whole frame on every row. FrameBuilder keeps one
+list per column instead and builds the DataFrame, with its dtypes, once at the end.
+
+Usage:
+    from frame_builder import FrameBuilder
+
+    rows = FrameBuilder({"wordID": "category", "wordDur": "float"})
+    rows.append({"wordID": "dog", "wordDur": 0.31})
+    df = rows.to_frame()
+"""
+
+import pandas as pd
+
+
+class FrameBuilder:
+    """Collects rows column by column.
+
+    Input:
+    -----
+    columns - dict
+        The column names in order, mapped to their pandas dtype, or to None to let pandas infer it.
+    """
+
+    def __init__(self, columns):
+        self.dtypes = dict(columns)
+        self.data = {name: [] for name in self.dtypes}
+
+    def append(self, row):
+        """Adds a row given as a dict of column -> value. Missing columns are filled with None."""
+        for name, values in self.data.items():
+            values.append(row.get(name))
+
+    def __len__(self):
+        return len(next(iter(self.data.values()), []))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the collected rows as a DataFrame with the requested dtypes."""
+        df = pd.DataFrame(self.data, columns=list(self.data))
+        return df.astype(
+            {name: dtype for name, dtype in self.dtypes.items() if dtype is not None}
+        )
@@ -0,0 +1,59 @@
+"""Run a per-speaker function over all Buckeye speakers, serially or on a process pool.
+
+Each worker process runs the initializer once (e.g. to open the pronunciation cache) and then
+loads the speakers it is given by name. Results come back in the order of the speaker list, so a
+parallel run produces exactly the same output as a serial one.
+
+Usage:
+    from parallel import add_workers_argument, map_speakers, speaker_names
+
+    results = map_speakers(process_speaker, speaker_names(path), workers=8,
+                           initializer=init_worker, initargs=(path,))
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from tqdm import tqdm
+
+
+def speaker_names(corpus_path) -> list:
+    """Returns the names of the speakers in the Buckeye corpus, in the order buckeye.corpus
+    yields them."""
+    files = sorted(glob.glob(os.path.join(corpus_path, "s[0-4][0-9].zip")))
+    return [os.path.splitext(os.path.basename(file))[0] for file in files]
+
+
+def load_speaker(corpus_path, name):
+    """Loads a single speaker of the Buckeye corpus by name."""
+    import buckeye
+
+    return buckeye.Speaker.from_zip(os.path.join(corpus_path, name + ".zip"))
+
+
+def map_speakers(function, speakers, workers=1, initializer=None, initargs=()) -> list:
+    """Applies function to every item of speakers and returns the results in the same order.
+    With workers > 1 the items are fanned out over a process pool; otherwise the initializer
+    and the function run in this process."""
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [function(speaker) for speaker in tqdm(speakers)]
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        return list(
+            tqdm(executor.map(function, speakers, chunksize=1), total=len(speakers))
+        )
+
+
+def add_workers_argument(parser):
+    """Adds the --workers option to an argument parser."""
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of speakers processed in parallel (default: 1, no process pool).",
+    )
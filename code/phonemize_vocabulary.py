@@ -0,0 +1,23 @@
+"""Transcribe every word type in the Buckeye corpus in one batched pass.
+
+The word types are read from the token table built by token_table.py. Fills the transcription
+cache (see pronunciations.py), so that regression_data.py, eventfilesV1.py and speech_rate.py only
+look transcriptions up instead of running the model once per token.
+
+Usage:
+    python phonemize_vocabulary.py
+"""
+
+from pronunciations import CachedPhonemizer
+from token_table import load_tokens, word_tokens
+
+if __name__ == "__main__":
+    phonemizer = CachedPhonemizer("../data/en_us_cmudict_forward.pt")
+
+    # Collect the unique orthographies of all speakers.
+    tokens = word_tokens(load_tokens(columns=["orthography", "is_pause"]))
+    vocabulary = tokens["orthography"].unique()
+
+    transcriptions = phonemizer.transcribe_all(vocabulary, lang="en_us", batch_size=256)
+    print("Transcribed {} word types.".format(len(transcriptions)))
+    print(phonemizer.report())
@@ -0,0 +1,278 @@
+"""Run the whole workflow, skipping every stage whose inputs have not changed.
+
+The stages are token_table.py and the workflow scripts, each declaring the files it reads and
+writes; buckeye_text.py is left out, as no stage reads its word lists. A stage is run when the hash
+of its script, the local modules it imports, its config and the content of its inputs differs from
+the hash stored after its last successful run, or when one of its outputs is missing. Since the
+inputs of a stage are the outputs of the stages before it, a change only reruns the stages
+downstream of it: a new alpha for trainNDL only reruns training and the predictor computation.
+
+Stage options are read from a JSON file mapping stage names to options, e.g.
+    {"trainNDL": {"alpha": 0.05, "betas": [0.1, 0.1]}}
+which are passed to the script as --alpha 0.05 --betas 0.1 0.1.
+
+Usage:
+    python pipeline.py [--config pipeline.json] [--workers N] [--force STAGE ...] [--dry-run]
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+from file_hash import file_sha256
+
+STATE = "../data/.pipeline/"
+
+
+class Stage:
+    """A workflow script with the paths it reads and writes.
+
+    Input:
+    -----
+    name - str
+        Name of the stage, also the key of its options in the config file.
+    script - str
+        The Python script that runs the stage.
+    inputs - list of str
+        Files and directories the stage reads.
+    outputs - list of str
+        Files and directories the stage writes.
+    parallel - bool
+        Whether the script takes the --workers option.
+    """
+
+    def __init__(self, name, script, inputs, outputs, parallel=False):
+        self.name = name
+        self.script = script
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parallel = parallel
+
+
+STAGES = [
+    Stage(
+        "token_table",
+        "token_table.py",
+        inputs=["../data/buckeye_corpus/"],
+        outputs=["../data/buckeye_tokens.parquet"],
+        parallel=True,
+    ),
+    Stage(
+        "phonemize_vocabulary",
+        "phonemize_vocabulary.py",
+        inputs=["../data/buckeye_tokens.parquet", "../data/en_us_cmudict_forward.pt"],
+        # The cache only makes the later stages faster, it does not change what they compute, so
+        # it is not one of their inputs.
+        outputs=["../data/transcriptions.sqlite"],
+    ),
+    Stage(
+        "regression_data",
+        "regression_data.py",
+        inputs=["../data/buckeye_tokens.parquet", "../data/en_us_cmudict_forward.pt"],
+        outputs=["../data/regression_data.csv"],
+        parallel=True,
+    ),
+    Stage(
+        "eventfilesV1",
+        "eventfilesV1.py",
+        inputs=["../data/buckeye_tokens.parquet", "../data/en_us_cmudict_forward.pt"],
+        outputs=[
+            "../data/updated_eventfiles/",
+            "../data/context.json",
+            "../data/word_cues.tsv",
+        ],
+    ),
+    Stage(
+        "correctingV1eventfiles",
+        "correctingV1eventfiles.py",
+        inputs=["../data/updated_eventfiles/", "../data/regression_data.csv"],
+        outputs=[
+            "../data/final_eventfile_buckeye.gz",
+            "../data/final_eventfile_buckeye.corpus/",
+            "../data/final_eventfile_buckeye.validation.json",
+        ],
+    ),
+    Stage(
+        "trainNDL",
+        "trainNDL.py",
+        inputs=["../data/final_eventfile_buckeye.gz"],
+        outputs=["../data/weights_buckeye.nc"],
+        parallel=True,
+    ),
+    Stage(
+        "prior_activation",
+        "prior_activation.py",
+        inputs=[
+            "../data/final_eventfile_buckeye.corpus/",
+            "../data/buckeye_tokens.parquet",
+            "../data/context.json",
+            "../data/word_cues.tsv",
+            "../data/regression_data.csv",
+            "../data/weights_buckeye.nc",
+        ],
+        outputs=["../data/regression_data_ndl.csv"],
+    ),
+    Stage(
+        "speech_rate",
+        "speech_rate.py",
+        inputs=[
+            "../data/buckeye_tokens.parquet",
+            "../data/en_us_cmudict_forward.pt",
+            "../data/regression_data_ndl.csv",
+        ],
+        outputs=["../data/regression_data_final.csv"],
+    ),
+]
+
+
+def list_files(path) -> list:
+    """Returns the files below a path in a fixed order, or the path itself if it is a file."""
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, directories, names in os.walk(path):
+        directories.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names))
+    return files
+
+
+def file_digest(path, known) -> str:
+    """Returns the sha256 hash of a file's content. Hashes are remembered in known by path, size
+    and modification time, so unchanged files are not read again."""
+    status = os.stat(path)
+    key = "{}:{}:{}".format(os.path.abspath(path), status.st_size, status.st_mtime_ns)
+    if key not in known:
+        known[key] = file_sha256(path)
+    return known[key]
+
+
+def local_modules(script, found=None) -> list:
+    """Returns the script and the modules next to it that it imports, directly or through other
+    local modules, sorted."""
+    found = set() if found is None else found
+    found.add(script)
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            path = os.path.join(os.path.dirname(script), name.split(".")[0] + ".py")
+            if os.path.exists(path) and path not in found:
+                local_modules(path, found)
+    return sorted(found)
+
+
+def stage_hash(stage, options, known) -> str:
+    """Returns the hash of a stage's script and the local modules it imports, its options and
+    the content of its inputs."""
+    digest = hashlib.sha256()
+    for module in local_modules(stage.script):
+        digest.update(module.encode())
+        digest.update(file_digest(module, known).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    for path in stage.inputs:
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                "Input {} of stage {} does not exist.".format(path, stage.name)
+            )
+        for file in list_files(path):
+            digest.update(file.encode())
+            digest.update(file_digest(file, known).encode())
+    return digest.hexdigest()
+
+
+def option_arguments(options) -> list:
+    """Turns a dict of options into command line arguments."""
+    arguments = []
+    for name, value in options.items():
+        flag = "--" + name.replace("_", "-")
+        if value is True:
+            arguments.append(flag)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            arguments.extend([flag] + [str(item) for item in value])
+        else:
+            arguments.extend([flag, str(value)])
+    return arguments
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def run(stages, config, workers=1, force=(), dry_run=False):
+    """Runs the stages in order, skipping those that are up to date."""
+    os.makedirs(STATE, exist_ok=True)
+    known = read_json(os.path.join(STATE, "file_hashes.json"), {})
+    stale = set()
+
+    for stage in stages:
+        options = config.get(stage.name, {})
+        state_path = os.path.join(STATE, stage.name + ".json")
+
+        # In a dry run the outputs of earlier stages have not been rebuilt yet.
+        if dry_run and stale.intersection(stage.inputs):
+            print("{}: would run, its inputs change".format(stage.name))
+            stale.update(stage.outputs)
+            continue
+
+        current = stage_hash(stage, options, known)
+        previous = read_json(state_path, {}).get("hash")
+        outputs_exist = all(os.path.exists(path) for path in stage.outputs)
+
+        if current == previous and outputs_exist and stage.name not in force:
+            print("{}: up to date".format(stage.name))
+            continue
+
+        command = [sys.executable, stage.script] + option_arguments(options)
+        if stage.parallel:
+            command += ["--workers", str(workers)]
+        print("{}: running {}".format(stage.name, " ".join(command)))
+        stale.update(stage.outputs)
+        if dry_run:
+            continue
+
+        subprocess.run(command, check=True)
+        write_json(state_path, {"hash": current, "options": options})
+        write_json(os.path.join(STATE, "file_hashes.json"), known)
+
+    write_json(os.path.join(STATE, "file_hashes.json"), known)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", help="JSON file with the options of each stage.")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--force",
+        nargs="*",
+        default=[],
+        choices=[stage.name for stage in STAGES],
+        help="Stages to run even if they are up to date.",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print what would be run."
+    )
+    args = parser.parse_args()
+
+    config = read_json(args.config, {}) if args.config else {}
+    run(STAGES, config, workers=args.workers, force=args.force, dry_run=args.dry_run)
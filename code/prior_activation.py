@@ -1,21 +1,61 @@
 """Compute prior and activation for all words.
 
 Usage:
-    python prior_activation.py
+    python prior_activation.py [--weights ../data/weights_buckeye.nc] [--dtype float32]
+                               [--sparse] [--threshold 1e-6]
 """
 
+import argparse
 import json
+import os
 
 import pandas as pd
-from tqdm.notebook import tqdm
 
+from context_cues import ContextConfig, context_lists
+from event_corpus import EventCorpus, corpus_path
+from event_index import OutcomeIndex, index_path, is_current
+from regression_data import forbidden_words
+from token_activations import first_event_cues, token_activations
+from token_table import load_tokens, word_tokens
 from variablesOtherPrior import *
+from weight_store import SparseWeightStore, WeightStore
+from word_cues import WORD_CUES, read_word_cues
 
 if __name__ == "__main__":
-    # Load the event file.
-    event_file = pd.read_csv(
-        "../data/final_eventfile_buckeye.gz", sep="\t", low_memory=True, engine="c"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dtype",
+        default="float64",
+        choices=["float64", "float32"],
+        help="Precision the weight matrix is memory-mapped in.",
     )
+    parser.add_argument("--weights", default="../data/weights_buckeye.nc")
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="Load the weights as a sparse matrix instead of memory-mapping the dense one.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.0,
+        help="Weights of at most this magnitude are dropped from the sparse matrix.",
+    )
+    args = parser.parse_args()
+
+    # Load the index of the event file, building it from the binary corpus when it is missing or
+    # was built from an earlier event file.
+    event_path = "../data/final_eventfile_buckeye.gz"
+    if is_current(index_path(event_path), event_path):
+        event_index = OutcomeIndex.load(index_path(event_path))
+    else:
+        if os.path.isdir(corpus_path(event_path)):
+            event_index = OutcomeIndex.from_corpus(
+                EventCorpus.load(corpus_path(event_path))
+            )
+        else:
+            event_index = OutcomeIndex.build([event_path])
+        event_index.save(index_path(event_path), event_path)
 
     # Load the word column from the regression dataframe.
     speaker_word = pd.read_csv(
@@ -27,50 +67,26 @@ if __name__ == "__main__":
     )
 
     # Load weights.
-    df = xr.open_dataarray("../output/weights/weights_buckeye.nc")
-    weight_matrix = df.to_pandas()
-    weight_matrix = weight_matrix.transpose()
-    weight_matrix.info(verbose=False, memory_usage="deep")
+    if args.sparse:
+        weight_matrix = SparseWeightStore.from_netcdf(
+            args.weights, threshold=args.threshold, dtype=args.dtype
+        )
+    else:
+        weight_matrix = WeightStore.from_netcdf(args.weights, dtype=args.dtype)
+    print(weight_matrix)
 
     words = speaker_word["wordID"].tolist()
 
-    prior_dict = {}
-
-    # Make a prior dictionary.
-    for index, word in tqdm(enumerate(words)):
-        if word not in prior_dict.keys():
-
-            prior_all = get_prior(
-                weight_matrix=weight_matrix, word_outcome=word, domain_specific=False
-            )
-            priors = get_prior(
-                weight_matrix=weight_matrix, word_outcome=word, domain_specific=True
-            )
+    # Compute the priors of all outcomes in one pass.
+    priors = compute_all_priors(weight_matrix)
+    word_types = speaker_word["wordID"].cat.categories
+    prior_dict = priors.reindex(word_types).to_dict(orient="index")
 
-            prior_dict[word] = {
-                "prior_all": prior_all,
-                "prior_segments": priors["Segment"],
-                "prior_syllables": priors["Syllable"],
-                "prior_context": priors["Context"],
-            }
     out_file = open("../data/otherPrior_dictionary.json", "w")
     json.dump(prior_dict, out_file, indent=6)
     out_file.close()
 
-    df = pd.DataFrame(
-        {
-            "prior_all": [],
-            "prior_segments": [],
-            "prior_syllables": [],
-            "prior_context": [],
-        }
-    )
-
-    for index, word in tqdm(enumerate(words)):
-        df.at[index, "prior_all"] = prior_dict[word]["prior_all"]
-        df.at[index, "prior_segments"] = prior_dict[word]["prior_segments"]
-        df.at[index, "prior_syllables"] = prior_dict[word]["prior_syllables"]
-        df.at[index, "prior_context"] = prior_dict[word]["prior_context"]
+    df = priors.reindex(words).reset_index(drop=True)
 
     # Loading whole regression dataset.
     regression_data = pd.read_csv(
@@ -95,50 +111,33 @@ if __name__ == "__main__":
 
     words = speaker_word["wordID"].tolist()
 
-    df = pd.DataFrame(
-        {
-            "activation_all": [],
-            "activation_segments": [],
-            "activation_syllables": [],
-            "activation_context": [],
-        }
+    # Every token is predicted by the cues of its word and by the words around it within its
+    # track, with the same context options as the event file. The context is built from all
+    # words, as in the event file, before the regression tokens are selected.
+    tokens = word_tokens(
+        load_tokens(columns=["speaker", "track", "orthography", "is_pause"])
+    )
+    contexts = context_lists(tokens, ContextConfig.load())
+    regression_tokens = ~tokens["orthography"].isin(forbidden_words).to_numpy()
+    contexts = [context for context, keep in zip(contexts, regression_tokens) if keep]
+    assert len(contexts) == len(words)
+
+    # The word cue table of eventfilesV1.py has the cue sets the events were built from, event
+    # files built without it fall back to the cues of the first event of every word.
+    if os.path.exists(WORD_CUES):
+        word_cues = read_word_cues()
+    else:
+        word_cues = first_event_cues(event_index)
+
+    df = token_activations(
+        weight_matrix=weight_matrix,
+        words=words,
+        word_cues=word_cues,
+        contexts=contexts,
     )
-
-    for index, word in tqdm(enumerate(words)):
-        if index == 0:
-            c1 = "c." + words[index + 1]
-            c2 = None
-        elif index == len(words) - 1:
-            c1 = "c." + words[index - 1]
-            c2 = None
-        else:
-            c1 = "c." + words[index - 1]
-            c2 = "c." + words[index + 1]
-
-        act = activation(
-            word_outcome=word,
-            c1=c1,
-            c2=c2,
-            event_files=[event_file],
-            weight_matrix=weight_matrix,
-            domain_specific=False,
-        )
-        act_domain = activation(
-            word_outcome=word,
-            c1=c1,
-            c2=c2,
-            event_files=[event_file],
-            weight_matrix=weight_matrix,
-            domain_specific=True,
-        )
-
-        df.at[index, "activation_all"] = act
-        df.at[index, "activation_segments"] = act_domain["Segment"]
-        df.at[index, "activation_syllables"] = act_domain["Syllable"]
-        df.at[index, "activation_context"] = act_domain["Context"]
 
     regression_data = pd.read_csv(
-        "../data/regression_data_prior.csv",
+        "../data/regression_data_Prior.csv",
         dtype={
             "speakerID": "category",
             "speakerAge": "category",
@@ -154,5 +153,5 @@ if __name__ == "__main__":
         low_memory=True,
     )
 
-    ende = pd.concat(obs=[regression_data, df], axis=1)
-    ende.to_csv("../data/regression_data.csv", index=False)
+    ende = pd.concat(objs=[regression_data, df], axis=1)
+    ende.to_csv("../data/regression_data_ndl.csv", index=False)
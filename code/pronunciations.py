@@ -0,0 +1,140 @@
+"""Persistent pronunciation cache for the grapheme-to-phoneme model.
+
+Transcriptions are stored in an SQLite file, keyed by orthography and by the hash of the
+Phonemizer checkpoint that produced them, so a word type only ever goes through the model once,
+no matter how many scripts or runs ask for it.
+
+Usage:
+    from pronunciations import CachedPhonemizer
+
+    phonemizer = CachedPhonemizer()
+    phonemizer("dog", lang="en_us")
+"""
+
+import sqlite3
+
+from file_hash import file_sha256
+
+CHECKPOINT = "../data/en_us_cmudict_forward.pt"
+CACHE = "../data/transcriptions.sqlite"
+
+
+class CachedPhonemizer:
+    """Drop-in replacement for a Phonemizer that reads and writes its transcriptions
+    to an on-disk cache. The model itself is only loaded on the first cache miss.
+
+    Input:
+    -----
+    checkpoint - str
+        Path to the Phonemizer checkpoint.
+    cache - str
+        Path to the SQLite file holding the transcriptions.
+    """
+
+    def __init__(self, checkpoint=CHECKPOINT, cache=CACHE):
+        self.checkpoint = checkpoint
+        self.model_hash = file_sha256(checkpoint)
+        self.model = None
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(cache, timeout=600)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcriptions ("
+            "orthography TEXT NOT NULL, "
+            "lang TEXT NOT NULL, "
+            "model TEXT NOT NULL, "
+            "transcription TEXT NOT NULL, "
+            "PRIMARY KEY (orthography, lang, model))"
+        )
+        self.connection.commit()
+
+    def __call__(self, word, lang="en_us") -> str:
+        """Returns the transcription of a word, running the model only if the word
+        has not been transcribed with this checkpoint before."""
+        word = str(word)
+        key = (word, lang)
+
+        if key in self.memory:
+            self.hits += 1
+            return self.memory[key]
+
+        row = self.connection.execute(
+            "SELECT transcription FROM transcriptions "
+            "WHERE orthography = ? AND lang = ? AND model = ?",
+            (word, lang, self.model_hash),
+        ).fetchone()
+        if row is not None:
+            self.hits += 1
+            self.memory[key] = row[0]
+            return row[0]
+
+        self.misses += 1
+        transcription = self.load_model()(word, lang=lang)
+        self.store({word: transcription}, lang=lang)
+        return transcription
+
+    def transcribe_all(self, words, lang="en_us", batch_size=256) -> dict:
+        """Transcribes a whole vocabulary at once and returns a dict of word -> transcription.
+        Only the word types missing from the cache are sent to the model, in batches
+        of batch_size."""
+        vocabulary = sorted({str(word) for word in words})
+        self.preload(lang=lang)
+
+        missing = [word for word in vocabulary if (word, lang) not in self.memory]
+        self.hits += len(vocabulary) - len(missing)
+        self.misses += len(missing)
+
+        # Commit every few batches so an interrupted run keeps what it has done.
+        chunk_size = batch_size * 16
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start : start + chunk_size]
+            transcriptions = self.load_model()(chunk, lang=lang, batch_size=batch_size)
+            self.store(dict(zip(chunk, transcriptions)), lang=lang)
+
+        return {word: self.memory[(word, lang)] for word in vocabulary}
+
+    def preload(self, lang="en_us"):
+        """Reads every cached transcription of this checkpoint into memory, so the
+        per-token loops never have to query the database. The cache holds the whole
+        vocabulary once phonemize_vocabulary.py has run."""
+        rows = self.connection.execute(
+            "SELECT orthography, transcription FROM transcriptions "
+            "WHERE lang = ? AND model = ?",
+            (lang, self.model_hash),
+        )
+        for word, transcription in rows:
+            self.memory[(word, lang)] = transcription
+
+    def load_model(self):
+        """Returns the Phonemizer, loading it from the checkpoint on first use."""
+        if self.model is None:
+            from dp.phonemizer import Phonemizer
+
+            self.model = Phonemizer.from_checkpoint(self.checkpoint)
+        return self.model
+
+    def store(self, transcriptions, lang="en_us"):
+        """Writes a dict of word -> transcription to the cache."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?)",
+            [
+                (word, lang, self.model_hash, transcription)
+                for word, transcription in transcriptions.items()
+            ],
+        )
+        self.connection.commit()
+        for word, transcription in transcriptions.items():
+            self.memory[(word, lang)] = transcription
+
+    def report(self) -> str:
+        """Returns the hit and miss counts as a printable string."""
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return "Transcription cache: {} hits, {} misses ({:.1%} hit rate)".format(
+            self.hits, self.misses, rate
+        )
+
+    def close(self):
+        self.connection.close()
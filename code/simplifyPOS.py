@@ -1,11 +1,79 @@
 """Simplify POS tags provided by the Buckeye corpus.
 
+simplify_pos maps every distinct tag once on the category level, so it can also be applied while
+building the regression table (regression_data.py --simplify-pos) instead of rewriting the file.
+
 Usage:
     python simplifyPOS.py
 """
 
+import numpy as np
 import pandas as pd
 
+NEW_TAGS = {
+    "CC": "CC",
+    "PP": "PP",
+    "CD": "CD",
+    "RB": "RB",
+    "DT": "DT",
+    "EX": "EX",
+    "RBS": "RB",
+    "FW": "FW",
+    "RP": "RP",
+    "IN": "IN",
+    "SYM": "SYM",
+    "JJ": "JJ",
+    "TO": "to",
+    "JJR": "JJ",
+    "UH": "UH",
+    "JJS": "JJ",
+    "VB": "V",
+    "LS": "LS",
+    "VBD": "V",
+    "MD": "MD",
+    "VBG": "V",
+    "NN": "NN",
+    "VBN": "V",
+    "NNS": "NN",
+    "VBP": "V",
+    "NNP": "NN",
+    "VBZ": "V",
+    "NNPS": "NN",
+    "WDT": "WH",
+    "PDT": "DT",
+    "WP": "WP",
+    "POS": "POS",
+    "WP$": "WP",
+    "PRP": "PRP",
+    "WRB": "RB",
+    "PP$": "PP",
+    "PRP_VBP": "PRP",
+    "V": "V",
+    "to": "TO",
+    "PRP$": "PRP",
+    "WH": "WH",
+    "RBR": "RB",
+}
+
+
+def simplify_pos(tags) -> pd.Series:
+    """Returns the simplified tags of a Series of POS tags as a categorical Series. Hybrid tags,
+    e.g. PRP_VBP, are simplified by their first tag. Missing tags stay missing."""
+    tags = tags.astype("category")
+
+    # Map each distinct tag once and rebuild the codes from the mapping.
+    simplified = [NEW_TAGS.get(tag.split("_")[0]) for tag in tags.cat.categories]
+    missing = [tag for tag, new in zip(tags.cat.categories, simplified) if new is None]
+    assert len(missing) == 0, missing
+
+    categories, new_codes = np.unique(simplified, return_inverse=True)
+    # Missing tags have code -1, which picks the appended -1.
+    codes = np.append(new_codes, -1)[tags.cat.codes.to_numpy()]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories), index=tags.index, name=tags.name
+    )
+
+
 if __name__ == "__main__":
     df = pd.read_csv(
         "../data/regression_data.csv",
@@ -24,67 +92,7 @@ if __name__ == "__main__":
     )
     df.info(verbose=False, memory_usage="deep")
 
-    new_tags = {
-        "CC": "CC",
-        "PP": "PP",
-        "CD": "CD",
-        "RB": "RB",
-        "DT": "DT",
-        "EX": "EX",
-        "RBS": "RB",
-        "FW": "FW",
-        "RP": "RP",
-        "IN": "IN",
-        "SYM": "SYM",
-        "JJ": "JJ",
-        "TO": "to",
-        "JJR": "JJ",
-        "UH": "UH",
-        "JJS": "JJ",
-        "VB": "V",
-        "LS": "LS",
-        "VBD": "V",
-        "MD": "MD",
-        "VBG": "V",
-        "NN": "NN",
-        "VBN": "V",
-        "NNS": "NN",
-        "VBP": "V",
-        "NNP": "NN",
-        "VBZ": "V",
-        "NNPS": "NN",
-        "WDT": "WH",
-        "PDT": "DT",
-        "WP": "WP",
-        "POS": "POS",
-        "WP$": "WP",
-        "PRP": "PRP",
-        "WRB": "RB",
-        "PP$": "PP",
-        "PRP_VBP": "PRP",
-        "V": "V",
-        "to": "TO",
-        "PRP$": "PRP",
-        "WH": "WH",
-        "RBR": "RB",
-    }
-
-    old_tags = df["wordPOS"].tolist()
-    missing = []
-
-    for index, tag in enumerate(old_tags):
-
-        # Take care of Hybrid tags
-        tag = tag.split("_")
-        tag = tag[0]
-
-        # Replace with new tag
-        if tag in new_tags.keys():
-            df.at[index, "wordPOS"] = new_tags[tag]
-        else:
-            missing.append((tag, index))
-
-    assert len(missing) == 0
+    df["wordPOS"] = simplify_pos(df["wordPOS"])
 
-    df.drop(labels=["Unnamed: 0"], inplace=True, axis=1)
+    df.drop(labels=["Unnamed: 0"], inplace=True, axis=1, errors="ignore")
     df.to_csv("../data/regression_data.csv", index=False)
@@ -1,20 +1,29 @@
 """Compute speech rate for each speaker utterance.
 Defined as number of syllables per utterance divided by the total duration of the utterance.
 
-Presupposes a dataframe with pauses, words and two empty columns: 'utteranceID' and 'global_sr'.
-
-Usage: 
-    python speech_rate.py
+An utterance is a run of words of a speaker that are not in forbidden_words. It ends at the next
+pause or forbidden word; a run that is still open at the end of a speaker is not counted. All
+utterances are found at once over the token table: the utterance ID is a cumulative sum over the
+tokens that start an utterance, the syllable counts are looked up per word type and the speech rate
+is a grouped ratio of syllables to duration.
+
+With --windows, the local speech rate around each word is added as well: the syllables per second
+of the k words before and the k words after it within its utterance, leaving out the word itself.
+Words without neighbours in their utterance get no local rate.
+
+Usage:
+    python speech_rate.py [--windows 1 2 3]
 """
 
-import os
-from typing import LiteralString
+import argparse
 
-import buckeye
+import numpy as np
 import pandas as pd
 import regex as re
-from tqdm import tqdm
-from dp.phonemizer import Phonemizer
+
+from pronunciations import CachedPhonemizer
+from syllabifier import syllabify_pronunciation
+from token_table import load_tokens
 
 
 def get_segments(word, upper=False) -> list[str]:
@@ -31,361 +40,134 @@ def get_segments(word, upper=False) -> list[str]:
         return segments
 
 
-def join_segments(word) -> LiteralString:
-    """Returns the segments of a word in a cue formatted string."""
-    segments = get_segments(word)
-    segments_y = []
-    for segment in segments:
-        segment = "s." + segment
-        segments_y.append(segment)
-    segments_joined = "_".join(segments_y)
-    return segments_joined
-
-
-def join_syllables(syllables) -> LiteralString:
-    """Returns the syllables of a word in a cue formatted string."""
-    syll_list = syllables.split()
-    syllable_cuestring = []
-    for entry in syll_list:
-        syllable_cue = "y." + entry
-        syllable_cuestring.append(syllable_cue.lower())
-    syllables_joined = "_".join(syllable_cuestring)
-    return syllables_joined
-
-
-def syllabify(language, word):
-    """Syllabifies the word, given a language configuration loaded with
-    loadLanguage. word is either a string of phonemes from the CMU
-    pronouncing dictionary set (with optional stress numbers after vowels),
-    or a Python list of phonemes, e.g. "B AE1 T" or ["B", "AE1", "T"]
-    """
-
-    if type(word) == str:
-        word = word.split()
-    # This is the returned data structure.
-    syllables = []
-
-    # This maintains a list of phonemes between nuclei.
-    internuclei = []
-
-    for phoneme in word:
-
-        phoneme = phoneme.strip()
-        if phoneme == "":
-            continue
-        stress = None
-        if phoneme[-1].isdigit():
-            stress = int(phoneme[-1])
-            phoneme = phoneme[0:-1]
-
-        # Split the consonants seen since the last nucleus into coda and
-        # onset.
-        if phoneme in language["vowels"]:
-
-            coda = None
-            onset = None
-
-            # If there is a period in the input, split there.
-            if "." in internuclei:
-                period = internuclei.index(".")
-                coda = internuclei[:period]
-                onset = internuclei[period + 1 :]
-
-            else:
-                # Make the largest onset we can. The 'split' variable marks
-                # the break point.
-                for split in range(0, len(internuclei) + 1):
-                    coda = internuclei[:split]
-                    onset = internuclei[split:]
-
-                    # If we are looking at a valid onset, or if we're at the
-                    # start of the word (in which case an invalid onset is
-                    # better than a coda that doesn't follow a nucleus), or
-                    # if we've gone through all of the onsets and we didn't
-                    # find any that are valid, then split the nonvowels
-                    # we've seen at this location.
-                    if (
-                        " ".join(onset) in language["onsets"]
-                        or len(syllables) == 0
-                        or len(onset) == 0
-                    ):
-                        break
-
-            # Tack the coda onto the coda of the last syllable. Can't do it
-            # if this is the first syllable.
-            if len(syllables) > 0:
-                syllables[-1][3].extend(coda)
-
-            # Make a new syllable out of the onset and nucleus.
-            syllables.append((stress, onset, [phoneme], []))
-
-            # At this point we've processed the internuclei list.
-            internuclei = []
-
-        elif not phoneme in language["consonants"] and phoneme != ".":
-            raise ValueError("Invalid phoneme: " + phoneme)
-
-        else:  # a consonant
-            internuclei.append(phoneme)
-
-    # Done looping through phonemes. We may have consonants left at the end.
-    # We may have even not found a nucleus.
-    if len(internuclei) > 0:
-        if len(syllables) == 0:
-            syllables.append((None, internuclei, [], []))
-        else:
-            syllables[-1][3].extend(internuclei)
-
-    return syllables
-
-
-def stringify(syllables):
-    """This function takes a syllabification returned by syllabify and
-    turns it into a string, with phonemes spearated by spaces and
-    syllables spearated by periods."""
-    ret = []
-    for syl in syllables:
-        stress, onset, nucleus, coda = syl
-        if stress != None and len(nucleus) != 0:
-            nucleus[0] += str(stress)
-        ret.append("".join(onset + nucleus + coda))
-    return " ".join(ret)
+forbidden_words = [
+    "oh",
+    "uh",
+    "ah",
+    "um",
+    "mm",
+    "hm",
+    "huh",
+    "uh-huh",
+    "um-hum",
+    "huh-uh",
+    "hum-hum",
+    "hmm",
+    "hmmm",
+    "mh",
+    "mmh",
+]
+
+
+def syllable_counts(orthographies) -> np.ndarray:
+    """Returns the number of syllables of each word type."""
+    counts = np.empty(len(orthographies), dtype=np.int64)
+    for code, orthography in enumerate(orthographies):
+        syllables = syllabify_pronunciation(
+            tuple(get_segments(orthography, upper=True))
+        )
+        counts[code] = len(syllables.split(" "))
+    return counts
+
+
+def utterances(tokens) -> pd.DataFrame:
+    """Returns the utterance, syllable count, duration and global speech rate of all utterance
+    words, given the token table. Utterances are numbered consecutively over all speakers, starting
+    at 1."""
+    orthography = tokens["orthography"]
+    in_utterance = (~tokens["is_pause"] & ~orthography.isin(forbidden_words)).to_numpy()
+    speaker = tokens["speaker"].cat.codes.to_numpy()
+
+    # A token starts an utterance if the token before it is not part of one of the same speaker.
+    same_speaker_before = np.r_[False, speaker[1:] == speaker[:-1]]
+    in_utterance_before = np.r_[False, in_utterance[:-1]] & same_speaker_before
+    utterance = np.cumsum(in_utterance & ~in_utterance_before)
+
+    # An utterance is only counted if a token of the same speaker follows it.
+    same_speaker_after = np.r_[same_speaker_before[1:], False]
+    closing = in_utterance & ~np.r_[in_utterance[1:], False] & same_speaker_after
+    complete = np.zeros(utterance[-1] + 1 if len(utterance) > 0 else 1, dtype=bool)
+    complete[utterance[closing]] = True
+    keep = in_utterance & complete[utterance]
+
+    # Count the syllables once per word type.
+    types = orthography[keep].cat.remove_unused_categories()
+    syllables = syllable_counts(types.cat.categories)[types.cat.codes.to_numpy()]
+
+    words = pd.DataFrame(
+        {
+            "items": types.astype(str).to_numpy(),
+            "utteranceID": np.unique(utterance[keep], return_inverse=True)[1] + 1,
+            "syllables": syllables,
+            "dur": tokens["dur"].to_numpy()[keep],
+        }
+    )
+    totals = words.groupby("utteranceID", sort=False)[["syllables", "dur"]].transform(
+        "sum"
+    )
+    words["global_sr"] = totals["syllables"] / totals["dur"]
+    return words
+
+
+def local_rates(words, windows) -> pd.DataFrame:
+    """Returns the local speech rate of each word for each window size k, as the columns
+    local_sr_<k>. The sums over the windows are differences of prefix sums, bounded by the
+    utterance of the word."""
+    position = np.arange(len(words))
+    utterance = words["utteranceID"].to_numpy()
+    new_utterance = np.r_[True, utterance[1:] != utterance[:-1]]
+    starts = np.flatnonzero(new_utterance)
+    ends = np.r_[starts[1:], len(words)]
+    lengths = ends - starts
+    start = np.repeat(starts, lengths)
+    end = np.repeat(ends, lengths)
+
+    syllables = words["syllables"].to_numpy(dtype=float)
+    dur = words["dur"].to_numpy(dtype=float)
+    syllable_sums = np.r_[0.0, np.cumsum(syllables)]
+    dur_sums = np.r_[0.0, np.cumsum(dur)]
+
+    rates = {}
+    for k in windows:
+        low = np.maximum(position - k, start)
+        high = np.minimum(position + k + 1, end)
+        window_syllables = syllable_sums[high] - syllable_sums[low] - syllables
+        window_dur = dur_sums[high] - dur_sums[low] - dur
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = window_syllables / window_dur
+        rates["local_sr_{}".format(k)] = np.where(high - low > 1, rate, np.nan)
+    return pd.DataFrame(rates, index=words.index)
 
 
 if __name__ == "__main__":
-    phonemizer = Phonemizer.from_checkpoint("../data/en_us_cmudict_forward.pt")
-
-    corpus = buckeye.corpus("../data/buckeye_corpus/")
-    df = pd.DataFrame({"items": [], "trackID": []})
-    num = 0
-
-    # English language settings for the language parameter in the syllabifier.
-    English = {
-        "consonants": [
-            "B",
-            "CH",
-            "D",
-            "DH",
-            "F",
-            "G",
-            "HH",
-            "JH",
-            "K",
-            "L",
-            "M",
-            "N",
-            "NG",
-            "P",
-            "R",
-            "S",
-            "SH",
-            "T",
-            "TH",
-            "V",
-            "W",
-            "Y",
-            "Z",
-            "ZH",
-        ],
-        "vowels": [
-            "AA",
-            "AE",
-            "AH",
-            "AO",
-            "AW",
-            "AY",
-            "EH",
-            "ER",
-            "EY",
-            "IH",
-            "IY",
-            "OW",
-            "OY",
-            "UH",
-            "UW",
-        ],
-        "onsets": [
-            "P",
-            "T",
-            "K",
-            "B",
-            "D",
-            "G",
-            "F",
-            "V",
-            "TH",
-            "DH",
-            "S",
-            "Z",
-            "SH",
-            "CH",
-            "JH",
-            "M",
-            "N",
-            "R",
-            "L",
-            "HH",
-            "W",
-            "Y",
-            "P R",
-            "T R",
-            "K R",
-            "B R",
-            "D R",
-            "G R",
-            "F R",
-            "TH R",
-            "SH R",
-            "P L",
-            "K L",
-            "B L",
-            "G L",
-            "F L",
-            "S L",
-            "T W",
-            "K W",
-            "D W",
-            "S W",
-            "S P",
-            "S T",
-            "S K",
-            "S F",
-            "S M",
-            "S N",
-            "G W",
-            "SH W",
-            "S P R",
-            "S P L",
-            "S T R",
-            "S K R",
-            "S K W",
-            "S K L",
-            "TH W",
-            "ZH",
-            "P Y",
-            "K Y",
-            "B Y",
-            "F Y",
-            "HH Y",
-            "V Y",
-            "TH Y",
-            "M Y",
-            "S P Y",
-            "S K Y",
-            "G Y",
-            "HH W",
-            "",
-        ],
-    }
-
-    for speaker in tqdm(corpus):
-        num = num + 1
-        tracks = {}
-        trackNum = 0
-        for track in speaker:
-            trackWords = []
-
-            for word in track.words:
-                if isinstance(word, buckeye.containers.Word):
-                    trackWords.append(word)
-                elif isinstance(word, buckeye.containers.Pause):
-                    pauseType = str(word).split(" ")
-                    trackWords.append(pauseType[1])
-
-            tracks[trackNum] = trackWords
-
-            trackNum = trackNum + 1
-
-        for entry in tracks.items():
-            for word in entry[1]:
-                df.loc[len(df)] = {"items": word, "trackID": entry[0]}
-
-    num = 0
-    pattern = r"\{(\w*)\}|\<(\w*)\>"
-    utteranceID = 1
-    inUtterance = bool
-    forbidden_words = [
-        "oh",
-        "uh",
-        "ah",
-        "um",
-        "mm",
-        "hm",
-        "huh",
-        "uh-huh",
-        "um-hum",
-        "huh-uh",
-        "hum-hum",
-        "hmm",
-        "hmmm",
-        "mh",
-        "mmh",
-    ]
-    # Appends all speaker dfs so there are no speaker overlaps while the df is being constructed.
-    all_dfs = []
-
-    for speaker in tqdm(corpus):
-        num = num + 1
-        df_name = str(num) + "df"
-        df_name = pd.DataFrame({"items": [], "utteranceID": [], "global_sr": []})
-        speaker_words = []
-
-        for track in speaker:
-            for word in track.words:
-                if isinstance(word, buckeye.containers.Word):
-                    speaker_words.append(word)
-                elif isinstance(word, buckeye.containers.Pause):
-                    pauseType = str(word).split(" ")
-                    speaker_words.append(pauseType[1])
-
-        # Collects words per utterance
-        wordsUtterance = []
-
-        for index, word in enumerate(speaker_words):
-
-            if (
-                isinstance(word, buckeye.containers.Word)
-                and word.orthography not in forbidden_words
-            ):
-                inUtterance = True
-            else:
-                inUtterance = False
-
-            if inUtterance == True:
-                raw_syllables = stringify(
-                    syllabify(English, get_segments(word.orthography, upper=True))
-                )
-                wordsUtterance.append(
-                    (index, word.dur, len(raw_syllables.split(" ")), word.orthography)
-                )
-
-            elif inUtterance == False and len(wordsUtterance) > 0:
-                totalDur = sum([item[1] for item in wordsUtterance])
-                totalSyl = sum([item[2] for item in wordsUtterance])
-                globalSr = totalSyl / totalDur
-
-                for entry in wordsUtterance:
-                    df_name.at[entry[0], "utteranceID"] = utteranceID
-                    df_name.at[entry[0], "global_sr"] = globalSr
-                    df_name.at[entry[0], "items"] = entry[3]
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--windows",
+        type=int,
+        nargs="*",
+        default=[],
+        help="Numbers of words on each side to compute the local speech rate over.",
+    )
+    args = parser.parse_args()
 
-                utteranceID = utteranceID + 1
-                wordsUtterance = []
+    phonemizer = CachedPhonemizer("../data/en_us_cmudict_forward.pt")
+    phonemizer.preload()
 
-        df_name.reset_index(drop=True, inplace=True)
-        all_dfs.append(df_name)
+    tokens = load_tokens(columns=["speaker", "orthography", "dur", "is_pause"])
+    assert tokens["speaker"].nunique() == 40
+    alle_dfs = utterances(tokens)
+    if args.windows:
+        alle_dfs = alle_dfs.join(local_rates(alle_dfs, args.windows))
 
-    assert len(all_dfs) == 40
     regression = pd.read_csv(
-        "../data/regression_data.csv",
+        "../data/regression_data_ndl.csv",
         low_memory=True,
         engine="c",
     )
-    alle_dfs = pd.concat(all_dfs, axis=0)
-    alle_dfs.reset_index(drop=True, inplace=True)
     finalDF = pd.concat([regression, alle_dfs], axis=1)
-    finalDF = finalDF.drop("items", axis=1)
+    finalDF = finalDF.drop(["items", "syllables", "dur"], axis=1)
     finalDF.to_csv(
         "../data/regression_data_final.csv",
         index=False,
     )
+    print(phonemizer.report())
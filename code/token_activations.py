@@ -0,0 +1,154 @@
+"""Token-level activations for all regression tokens at once.
+
+Every token's cue set (the segment and syllable cues of its word, plus its context cues) is
+encoded as one row of a sparse token x cue incidence matrix. The activation of a token is the
+product of its row with the weight column of its own outcome, so instead of the full token x
+outcome product only the non-zero cells of the incidence matrix are gathered from the weight
+matrix and summed per row.
+The numbers are the same as calling activation() from variablesOtherPrior.py for every token,
+except that a cue is counted once per token, e.g. when the same word occurs twice in a token's
+context, as pyndl trains with remove_duplicates=True.
+
+Usage:
+    from token_activations import first_event_cues, token_activations
+
+    word_cues = first_event_cues(event_file)  # or read_word_cues() of word_cues.py
+    activations = token_activations(weight_matrix, words, word_cues, contexts)
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from event_index import OutcomeIndex
+from variablesOtherPrior import domain_masks
+
+
+def first_event_cues(event_file) -> dict:
+    """Return a dict of outcome -> segment and syllable cues of the first event of that outcome,
+    as get_all_predicting_cues does with no_context=True. event_file is either a DataFrame or
+    an OutcomeIndex."""
+    if isinstance(event_file, OutcomeIndex):
+        return {
+            outcome: event_file.predicting_cues(outcome, no_context=True)
+            for outcome in event_file.outcomes
+        }
+
+    first_events = event_file.drop_duplicates(subset="outcomes", keep="first")
+    word_cues = {}
+    for outcome, cues in zip(first_events["outcomes"], first_events["cues"]):
+        word_cues[outcome] = sorted(
+            {
+                cue
+                for cue in str(cues).split("_")
+                if cue.startswith("y.") or cue.startswith("s.")
+            }
+        )
+    return word_cues
+
+
+def cue_incidence(cue_lists, cue_index) -> sparse.csr_matrix:
+    """Return a sparse binary row x cue matrix of the cues that occur in each list, a cue that
+    occurs twice in a list is counted once. Cues that are not in cue_index have no weights and
+    are left out."""
+    rows = []
+    columns = []
+    for row, cues in enumerate(cue_lists):
+        for cue in cues:
+            column = cue_index.get(cue)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    # Duplicate (row, column) pairs are summed when converting to CSR, then counted once, as
+    # pyndl trains with remove_duplicates=True.
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(cue_lists), len(cue_index)),
+    )
+    incidence.data[:] = 1
+    return incidence
+
+
+def gather_activations(
+    incidence, values, outcome_columns, absolute=False
+) -> np.ndarray:
+    """Return, for every row of the incidence matrix, the sum of the weights of its cues to the
+    outcome in outcome_columns. Only the non-zero cells of the incidence matrix are looked up.
+    """
+    incidence = incidence.tocoo()
+    # Indexing a scipy.sparse matrix returns a 1 x n matrix, hence the ravel.
+    weights = np.asarray(values[incidence.col, outcome_columns[incidence.row]]).ravel()
+    if absolute:
+        weights = np.absolute(weights)
+    return np.bincount(
+        incidence.row, weights=weights * incidence.data, minlength=incidence.shape[0]
+    )
+
+
+def token_activations(weight_matrix, words, word_cues, contexts) -> pd.DataFrame:
+    """Calculate the activation of every token, overall and per domain.
+
+    Input:
+    -----
+    weight_matrix - pandas.DataFrame, WeightStore or SparseWeightStore
+        A weight matrix from a trained NDL model with the cues as index and the outcomes as columns.
+    words - list of str
+        The outcome of every token.
+    word_cues - dict
+        The segment and syllable cues of every outcome, see first_event_cues.
+    contexts - list of list of str
+        The context cues of every token, e.g. ['c.the', 'c.barked'].
+
+    Output:
+    -------
+    activations - pandas.DataFrame
+        A dataframe with one row per token and the columns 'activation_all', 'activation_segments',
+        'activation_syllables' and 'activation_context'. Tokens whose outcome is not in the weight
+        matrix get NaN.
+    """
+    cue_index = {cue: index for index, cue in enumerate(weight_matrix.index)}
+    outcome_index = {
+        outcome: index for index, outcome in enumerate(weight_matrix.columns)
+    }
+    values = weight_matrix.values
+
+    outcome_columns = np.array([outcome_index.get(word, -1) for word in words])
+    known = outcome_columns >= 0
+    outcome_columns[~known] = 0
+
+    # Word-internal cues are the same for every token of a type, so build them per type.
+    types = list(word_cues.keys())
+    type_index = {word: index for index, word in enumerate(types)}
+    type_incidence = cue_incidence([word_cues[word] for word in types], cue_index)
+    token_types = np.array([type_index.get(word, -1) for word in words])
+    has_cues = token_types >= 0
+    token_types[~has_cues] = 0
+    internal = sparse.diags(has_cues.astype(float)) @ type_incidence[token_types]
+
+    surrounding = cue_incidence(contexts, cue_index)
+
+    _, segment_mask, syllable_mask, context_mask = domain_masks(weight_matrix.index).T
+    segments = internal @ sparse.diags(segment_mask.astype(float))
+    syllables = internal @ sparse.diags(syllable_mask.astype(float))
+    context = surrounding @ sparse.diags(context_mask.astype(float))
+
+    activations = pd.DataFrame(
+        {
+            "activation_all": gather_activations(
+                (internal + surrounding).sign(), values, outcome_columns
+            ),
+            "activation_segments": gather_activations(
+                segments, values, outcome_columns, absolute=True
+            ),
+            "activation_syllables": gather_activations(
+                syllables, values, outcome_columns, absolute=True
+            ),
+            "activation_context": gather_activations(
+                context, values, outcome_columns, absolute=True
+            ),
+        }
+    )
+    activations[~known] = np.nan
+
+    return activations
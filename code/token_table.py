@@ -0,0 +1,97 @@
+"""Parse the Buckeye corpus once into a columnar token table.
+
+Every word and pause of every track becomes one row, in corpus order, with the columns
+    speaker, speaker_age, speaker_sex, interviewer, track, index, orthography, pos, dur, begin, end,
+    is_pause, pause_type
+String columns are categorical, so the Parquet file stores them dictionary-encoded. The scripts
+that used to iterate over buckeye.corpus themselves read this table instead.
+
+Usage:
+    python token_table.py [--workers N]
+"""
+
+import argparse
+
+import buckeye
+import pandas as pd
+
+from frame_builder import FrameBuilder
+from parallel import add_workers_argument, load_speaker, map_speakers, speaker_names
+
+CORPUS = "../data/buckeye_corpus/"
+TOKENS = "../data/buckeye_tokens.parquet"
+
+COLUMNS = {
+    "speaker": "category",
+    "speaker_age": "category",
+    "speaker_sex": "category",
+    "interviewer": "category",
+    "track": "category",
+    "index": "int32",
+    "orthography": "category",
+    "pos": "category",
+    "dur": "float",
+    "begin": "float",
+    "end": "float",
+    "is_pause": "bool",
+    "pause_type": "category",
+}
+
+
+def process_speaker(name) -> pd.DataFrame:
+    """Returns the token rows of all tracks of a speaker."""
+    speaker = load_speaker(CORPUS, name)
+    rows = FrameBuilder(COLUMNS)
+
+    for track in speaker:
+        for index, word in enumerate(track.words):
+            row = {
+                "speaker": speaker.name,
+                "speaker_age": speaker.age,
+                "speaker_sex": speaker.sex,
+                "interviewer": speaker.interviewer,
+                "track": track.name,
+                "index": index,
+                "dur": word.dur,
+                "begin": word.beg,
+                "end": word.end,
+            }
+            if isinstance(word, buckeye.containers.Word):
+                row["orthography"] = word.orthography
+                row["pos"] = word.pos
+                row["is_pause"] = False
+            elif isinstance(word, buckeye.containers.Pause):
+                row["pause_type"] = word.entry
+                row["is_pause"] = True
+            else:
+                continue
+            rows.append(row)
+
+    return rows.to_frame()
+
+
+def load_tokens(path=TOKENS, columns=None) -> pd.DataFrame:
+    """Reads the token table, optionally only some of its columns."""
+    return pd.read_parquet(path, columns=columns)
+
+
+def word_tokens(tokens, exclude=()) -> pd.DataFrame:
+    """Returns the rows of the token table that are words, leaving out those in exclude."""
+    mask = ~tokens["is_pause"]
+    if len(exclude) > 0:
+        mask &= ~tokens["orthography"].isin(exclude)
+    return tokens[mask]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    speakers = map_speakers(
+        process_speaker, speaker_names(CORPUS), workers=args.workers
+    )
+
+    # Categories differ between speakers, so set them again on the whole table.
+    tokens = pd.concat(speakers, ignore_index=True).astype(COLUMNS)
+    tokens.to_parquet(TOKENS, index=False)
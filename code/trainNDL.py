@@ -1,20 +1,370 @@
 """Train an NDL model.
 
+--events-per-shard/--speaker-shards train in ordered, checkpointed shards (see train_in_shards).
+--partitions trains the outcomes in partitions in parallel and merges them (see train_partition).
+--engine equilibrium solves for the equilibrium weights instead (see equilibrium.py).
+
 Usage:
-    python trainNDL.py
+    python trainNDL.py [--alpha 0.1] [--betas 0.1 0.1] [--lambda 1.0]
+    python trainNDL.py --engine equilibrium [--solver sparse|dense] [--ridge 1e-6]
+    python trainNDL.py --events-per-shard 1000000 [--checkpoints DIR] [--restart]
+    python trainNDL.py --partitions 8 [--workers 8]
+    python trainNDL.py --partitions 8 --partition 3
+    python trainNDL.py --partitions 8 --merge
 """
 
+import argparse
+import functools
+import glob
+import gzip
+import json
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import xarray as xr
 from pyndl import ndl
 
+from equilibrium import RIDGE, cooccurrence_counts, equilibrium_weights
+from event_stream import SPEAKER_EVENTS, read_event_chunks, speaker_event_files
+from file_hash import file_sha256
+
+PLACEHOLDER = "<none>"
+
+
+def shard_sources(events, events_per_shard=None) -> list:
+    """Returns the files the shards are read from, the event file or the speaker event files."""
+    return [events] if events_per_shard is not None else speaker_event_files()
+
+
+def event_shards(events, events_per_shard=None):
+    """Yields the events in ordered shards, either every events_per_shard events of the event
+    file, or one shard per speaker event file."""
+    if events_per_shard is not None:
+        yield from read_event_chunks(events, chunksize=events_per_shard)
+    else:
+        for path in shard_sources(events, events_per_shard):
+            yield pd.concat(read_event_chunks(path), ignore_index=True)
+
+
+def write_shard(shard, path):
+    """Writes a shard of events as a gzipped event file."""
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        f.write("cues\toutcomes\n")
+        shard.to_csv(f, sep="\t", header=False, index=False)
+
+
+def checkpoint_path(checkpoints, shard) -> str:
+    return os.path.join(checkpoints, "shard_{:05d}.nc".format(shard))
+
+
+def latest_checkpoint(checkpoints) -> tuple:
+    """Returns the number of shards trained and the weights after them, from the latest
+    checkpoint that can be read, or (0, None) if there is none."""
+    for path in sorted(
+        glob.glob(os.path.join(checkpoints, "shard_*.nc")), reverse=True
+    ):
+        try:
+            with xr.open_dataarray(path) as weights:
+                weights = weights.load()
+        except (OSError, ValueError) as error:
+            print("Skipping unreadable checkpoint {}: {}".format(path, error))
+            continue
+        shard = int(os.path.basename(path)[len("shard_") : -len(".nc")])
+        return shard + 1, weights
+    return 0, None
+
+
+def train_in_shards(
+    events, checkpoints, settings, events_per_shard=None, keep=2, restart=False
+):
+    """Trains shard by shard, saving a checkpoint after every shard and resuming after the
+    latest one. Returns the final weights.
+
+    The shards are every events_per_shard events of the event file, or the per-speaker event
+    files in the order they are merged in, and each shard continues from the weights of the
+    shard before it. Since the Rescorla-Wagner updates are applied event by event, the final
+    weights are the same as those of a single run over the event file; only the order of the
+    cues and outcomes in the weight matrix can differ. Checkpoints are not resumed if the
+    learning parameters or the content of the event files have changed since.
+
+    Input:
+    -----
+    events - str
+        Path of the event file, used if events_per_shard is given.
+    checkpoints - str
+        Directory the checkpoints are saved in.
+    settings - dict
+        Keyword arguments of ndl.ndl, e.g. alpha and betas.
+    events_per_shard - int or None
+        Number of events per shard, or None for one shard per speaker event file.
+    keep - int
+        Number of most recent checkpoints kept on disk.
+    restart - bool
+        Whether to discard existing checkpoints and train from the first shard.
+    """
+    if restart and os.path.isdir(checkpoints):
+        shutil.rmtree(checkpoints)
+    os.makedirs(checkpoints, exist_ok=True)
+
+    # Checkpoints are only valid for the same events, sharding and learning parameters. The
+    # events are identified by the content of the files the shards are read from, so checkpoints
+    # of regenerated events are never resumed.
+    manifest_path = os.path.join(checkpoints, "manifest.json")
+    manifest = dict(
+        settings,
+        events_per_shard=events_per_shard,
+        sources={
+            path: file_sha256(path) for path in shard_sources(events, events_per_shard)
+        },
+    )
+    manifest.pop("verbose", None)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        current = json.loads(json.dumps(manifest))
+        if previous != current:
+            changed = sorted(
+                key
+                for key in set(previous) | set(current)
+                if previous.get(key) != current.get(key)
+            )
+            raise ValueError(
+                "The checkpoints in {} were trained with other {}, use --restart to train "
+                "again.".format(checkpoints, ", ".join(changed))
+            )
+    else:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    done, weights = latest_checkpoint(checkpoints)
+    if done > 0:
+        print("Resuming after shard {}.".format(done))
+
+    shard_events = os.path.join(checkpoints, "shard.gz")
+    for shard, events_df in enumerate(event_shards(events, events_per_shard)):
+        if shard < done:
+            continue
+        write_shard(events_df, shard_events)
+        weights = ndl.ndl(events=shard_events, weights=weights, **settings)
+
+        # Write to a temporary file, so an interrupted run never leaves a truncated checkpoint.
+        path = checkpoint_path(checkpoints, shard)
+        weights.to_netcdf(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if shard >= keep:
+            old = checkpoint_path(checkpoints, shard - keep)
+            if os.path.exists(old):
+                os.remove(old)
+        print("Trained shard {} ({} events).".format(shard, len(events_df)))
+
+    if os.path.exists(shard_events):
+        os.remove(shard_events)
+    return weights
+
+
+def outcome_partition(outcomes, partitions) -> pd.Series:
+    """Returns the partition of each outcome. The partition is a hash of the outcome, so every
+    process and machine assigns outcomes the same way without sharing the vocabulary."""
+    return outcomes.map(
+        lambda outcome: zlib.crc32(outcome.encode("utf-8")) % partitions
+    )
+
+
+def partition_path(output, partition, partitions, extension=".nc") -> str:
+    """Returns the path of the weights, or the events, of a partition next to output."""
+    root, _ = os.path.splitext(output)
+    return "{}.part{:03d}of{:03d}{}".format(root, partition, partitions, extension)
+
+
+def write_partition_events(events, path, partition, partitions, chunksize=100000):
+    """Writes the event file with all outcomes outside the partition replaced by PLACEHOLDER.
+    Every partition trained at the same time has such a copy of the whole event file on disk, so
+    they are compressed with the fastest gzip level and removed once the partition is trained.
+    """
+    with gzip.open(
+        path + ".tmp", "wt", compresslevel=1, encoding="utf-8", newline=""
+    ) as f:
+        f.write("cues\toutcomes\n")
+        for chunk in read_event_chunks(events, chunksize=chunksize):
+            outside = outcome_partition(chunk["outcomes"], partitions) != partition
+            chunk.loc[outside, "outcomes"] = PLACEHOLDER
+            chunk.to_csv(f, sep="\t", header=False, index=False)
+    os.replace(path + ".tmp", path)
+
+
+def train_partition(partition, events, output, partitions, settings) -> str:
+    """Trains the outcomes of one of partitions partitions on the event file events and returns
+    the path of their weights next to output. A partition whose weights already exist is not
+    trained again.
+
+    As the weights of an outcome only depend on the cues of the events and on whether the
+    outcome is present in them, the outcomes of other partitions are replaced by PLACEHOLDER,
+    whose weights are dropped. The partitions are merged into output with merge_partitions.
+    """
+    path = partition_path(output, partition, partitions)
+    if os.path.exists(path):
+        return path
+
+    events_path = partition_path(output, partition, partitions, ".events.gz")
+    write_partition_events(events, events_path, partition, partitions)
+    weights = ndl.ndl(events=events_path, **settings)
+    weights = weights.drop_sel(outcomes=[PLACEHOLDER], errors="ignore")
+    weights.to_netcdf(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    os.remove(events_path)
+    return path
+
+
+def merge_partitions(paths, output):
+    """Concatenates the weights of all partitions along the outcomes into output."""
+    parts = [xr.open_dataarray(path) for path in paths]
+    cues = parts[0].coords["cues"]
+    weights = xr.concat([part.sel(cues=cues) for part in parts], dim="outcomes")
+    weights.attrs = parts[0].attrs
+    weights.to_netcdf(output)
+    for part in parts:
+        part.close()
+
+
 if __name__ == "__main__":
-    weights = ndl.ndl(
-        events="../data/final_eventfile_buckeye.gz",
-        alpha=0.1,
-        betas=(0.1, 0.1),
-        lambda_=1.0,
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", default="../data/final_eventfile_buckeye.gz")
+    parser.add_argument("--output", default="../data/weights_buckeye.nc")
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--betas", type=float, nargs=2, default=(0.1, 0.1))
+    parser.add_argument("--lambda", dest="lambda_", type=float, default=1.0)
+    parser.add_argument(
+        "--engine",
+        default="rw",
+        choices=["rw", "equilibrium"],
+        help="Learn the weights event by event (rw) or solve for the equilibrium weights.",
+    )
+    parser.add_argument("--solver", default="sparse", choices=["sparse", "dense"])
+    parser.add_argument(
+        "--ridge", type=float, default=RIDGE, help="Ridge of the equilibrium equations."
+    )
+    shards = parser.add_mutually_exclusive_group()
+    shards.add_argument(
+        "--events-per-shard", type=int, help="Train and checkpoint every N events."
+    )
+    shards.add_argument(
+        "--speaker-shards",
+        action="store_true",
+        help="Train and checkpoint per speaker event file in " + SPEAKER_EVENTS,
+    )
+    parser.add_argument("--checkpoints", default="../data/weights_buckeye.checkpoints/")
+    parser.add_argument(
+        "--keep", type=int, default=2, help="Number of checkpoints kept on disk."
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Discard existing checkpoints."
+    )
+    shards.add_argument(
+        "--partitions", type=int, help="Train the outcomes in K partitions in parallel."
+    )
+    parser.add_argument(
+        "--partition", type=int, help="Only train this partition of --partitions."
+    )
+    parser.add_argument(
+        "--merge", action="store_true", help="Only merge the trained partitions."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of partitions trained in parallel (default: 1, no process pool).",
+    )
+    args = parser.parse_args()
+    if args.engine == "equilibrium":
+        if args.betas[0] != args.betas[1]:
+            parser.error("The equilibrium engine needs equal --betas.")
+        if (
+            args.partitions is not None
+            or args.events_per_shard is not None
+            or args.speaker_shards
+        ):
+            parser.error(
+                "The equilibrium engine is solved at once, without shards or partitions."
+            )
+    if args.partitions is None and (args.partition is not None or args.merge):
+        parser.error("--partition and --merge need --partitions.")
+    if args.partitions is not None and args.partitions < 1:
+        parser.error("--partitions must be at least 1.")
+    if args.partition is not None and not 0 <= args.partition < args.partitions:
+        parser.error(
+            "--partition must be between 0 and {}.".format(args.partitions - 1)
+        )
+
+    settings = dict(
+        alpha=args.alpha,
+        betas=tuple(args.betas),
+        lambda_=args.lambda_,
         method="openmp",
         remove_duplicates=True,
         verbose=True,
     )
 
-    weights.to_netcdf("../data/weights_buckeye.nc")
+    if args.engine == "equilibrium":
+        cue_cue, cue_outcome, cues, outcomes = cooccurrence_counts(args.events)
+        weights = equilibrium_weights(
+            cue_cue,
+            cue_outcome,
+            cues,
+            outcomes,
+            lambda_=args.lambda_,
+            ridge=args.ridge,
+            solver=args.solver,
+        )
+        weights.to_netcdf(args.output)
+    elif args.partitions is not None:
+        partitions = (
+            range(args.partitions) if args.partition is None else [args.partition]
+        )
+        if not args.merge:
+            # Share the cores between the partitions trained at the same time.
+            settings["number_of_threads"] = max(
+                1, os.cpu_count() // max(1, args.workers)
+            )
+            train = functools.partial(
+                train_partition,
+                events=args.events,
+                output=args.output,
+                partitions=args.partitions,
+                settings=settings,
+            )
+            if args.workers <= 1:
+                for partition in partitions:
+                    train(partition)
+            else:
+                with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                    list(executor.map(train, partitions))
+        if args.partition is None or args.merge:
+            paths = [
+                partition_path(args.output, partition, args.partitions)
+                for partition in range(args.partitions)
+            ]
+            missing = [path for path in paths if not os.path.exists(path)]
+            if missing:
+                raise FileNotFoundError(
+                    "{} of {} partitions are not trained: {}".format(
+                        len(missing), args.partitions, ", ".join(missing)
+                    )
+                )
+            merge_partitions(paths, args.output)
+    else:
+        if args.events_per_shard is not None or args.speaker_shards:
+            weights = train_in_shards(
+                args.events,
+                args.checkpoints,
+                settings,
+                events_per_shard=args.events_per_shard,
+                keep=args.keep,
+                restart=args.restart,
+            )
+        else:
+            weights = ndl.ndl(events=args.events, **settings)
+
+        weights.to_netcdf(args.output)
@@ -2,6 +2,9 @@
 """
 
 import numpy as np
+import pandas as pd
+
+from event_index import OutcomeIndex
 
 
 def is_cue(weight_matrix, cue):
@@ -74,8 +77,8 @@ def get_all_predicting_cues(event_files, outcome, per_domain=False, no_context=F
 
     Input:
     -----
-    event_files - list
-         A list of event files.
+    event_files - list or OutcomeIndex
+         A list of event files, or the index of an event file (see event_index.py).
     outcome - strvsc
         The word that the predicting cues should be retrieved for.
     per_domain - bool
@@ -91,6 +94,12 @@ def get_all_predicting_cues(event_files, outcome, per_domain=False, no_context=F
         A dict of the predicting cues for each domain for the given outcome, taken from the event files.
     """
 
+    # Look the cues up in the index if there is one.
+    if isinstance(event_files, OutcomeIndex):
+        return event_files.predicting_cues(
+            outcome=outcome, per_domain=per_domain, no_context=no_context
+        )
+
     # Only look for the outcome once to find an return only syllable and segment cues.
     if no_context:
         predicting_cues = []
@@ -107,16 +116,12 @@ def get_all_predicting_cues(event_files, outcome, per_domain=False, no_context=F
 
     # Look for all context cues for the outcome.
     else:
-        predicting_cues = []
+        # A dict keeps the cues unique and in the order they were first seen.
+        predicting_cues = {}
         for file in event_files:
-            outcomes = file["outcomes"].tolist()
-            for index, word in enumerate(outcomes):
-                if word == outcome:
-                    cues = file.at[index, "cues"]
-                    cues = cues.split("_")
-                    for cue in cues:
-                        if cue not in predicting_cues:
-                            predicting_cues.extend(cues)
+            for cues in file.loc[file["outcomes"] == outcome, "cues"]:
+                predicting_cues.update(dict.fromkeys(cues.split("_")))
+        predicting_cues = list(predicting_cues)
 
     if per_domain:
         context = [cue for cue in predicting_cues if cue.startswith("c.")]
@@ -168,6 +173,55 @@ def sum_domain_cues(weight_matrix, cues, outcome):
     return all_prior
 
 
+def domain_masks(cues):
+    """Return a boolean cue x domain matrix with one column per prior: all cues, segment cues,
+    syllable cues and context cues."""
+    cues = pd.Index(cues).astype(str)
+    return np.column_stack(
+        [
+            np.ones(len(cues), dtype=bool),
+            cues.str.startswith("s."),
+            cues.str.startswith("y."),
+            cues.str.startswith("c."),
+        ]
+    )
+
+
+def compute_all_priors(weights, block_size=4096):
+    """Calculate the prior measures of every outcome at once.
+    Equivalent to calling get_prior with and without domain_specific for each outcome, but done
+    as one matrix product of the absolute weights with the domain masks of the cues.
+
+    Input:
+    -----
+    weights - pandas.DataFrame, WeightStore or SparseWeightStore
+        A weight matrix from a trained NDL model with the cues as index and the outcomes as columns.
+    block_size - int
+        The number of outcomes handled at once.
+
+    Output:
+    ------
+    priors - pandas.DataFrame
+        A dataframe indexed by outcome with the columns 'prior_all', 'prior_segments',
+        'prior_syllables' and 'prior_context'.
+    """
+    values = weights.values
+    masks = domain_masks(weights.index).astype(values.dtype)
+
+    # Work through the outcomes in blocks, so the absolute weights are never copied at once.
+    # abs() and @ also work on scipy.sparse matrices, so only stored weights are summed.
+    priors = np.empty((values.shape[1], masks.shape[1]), dtype=values.dtype)
+    for start in range(0, values.shape[1], block_size):
+        block = abs(values[:, start : start + block_size])
+        priors[start : start + block_size] = block.T @ masks
+
+    return pd.DataFrame(
+        priors,
+        index=weights.columns,
+        columns=["prior_all", "prior_segments", "prior_syllables", "prior_context"],
+    )
+
+
 def get_prior(weight_matrix, word_outcome, domain_specific=False):
     """Calculate the prior measures of an outcome.
     Takes the sum of all of the weights in the outcome vector, or the ones ones for each domain
@@ -328,7 +382,7 @@ def get_activation(
     # Get domain specific activation
     if domain_specific:
         if not cues:
-            cues = get_predicting_cues(
+            cues = get_all_predicting_cues(
                 event_files=event_files, outcome=outcome, per_domain=True
             )
 
@@ -342,7 +396,7 @@ def get_activation(
         all_weights = []
 
         if not cues:
-            cues = get_predicting_cues(
+            cues = get_all_predicting_cues(
                 event_files=event_files, outcome=outcome, per_domain=False
             )
 
@@ -363,8 +417,8 @@ def get_activation_diversity(weight_matrix, event_files, input_word):
     weight_matrix - pandas.DataFrame
         A weight matrix from a trained NDL model that has a column containing the sums of the cue vectors
         called 'cue_sums', and a row containing the sums of the outcome vectors called 'outcome_sums'.
-    event_files - list
-         A list of event files.
+    event_files - list or OutcomeIndex
+         A list of event files, or the index of an event file (see event_index.py).
     input_word - str
         A cue from the weight matrix.
 
@@ -378,27 +432,24 @@ def get_activation_diversity(weight_matrix, event_files, input_word):
     if is_cue(weight_matrix=weight_matrix, cue=input_word):
         cue = input_word
     else:
-        return "The word " + cue + " is not in the cues of the weight matrix."
+        return "The word " + input_word + " is not in the cues of the weight matrix."
+
+    if not isinstance(event_files, OutcomeIndex):
+        event_files = OutcomeIndex.build(event_files)
+    if cue not in event_files.cue_ids:
+        return 0
 
-    # Go through cue strings.
+    # Every event the cue occurs in adds the absolute activation of its outcome.
     all_activations = []
-    for file in event_files:
-        cues = weight_matrix.index
-        for index, word in enumerate(cues):
-            # If the cue is in there, get the corresponding outcome and its activation.
-            if cue in word:
-                outcome = file.at[index, "outcomes"]
-                cues = get_predicting_cues(
-                    event_files=event_files, outcome=outcome, per_domain=False
-                )
-                activation = get_activation(
-                    cues=cues,
-                    domain_specific=False,
-                    event_files=event_files,
-                    weight_matrix=weight_matrix,
-                    word_outcome=outcome,
-                )
-                all_activations.append(np.absolute(activation))
+    outcomes, counts = event_files.cue_events(cue)
+    for outcome, count in zip(outcomes, counts):
+        activation = get_activation(
+            domain_specific=False,
+            event_files=event_files,
+            weight_matrix=weight_matrix,
+            word_outcome=outcome,
+        )
+        all_activations.append(count * np.absolute(activation))
 
     act_div = sum(all_activations)
     return act_div
@@ -0,0 +1,246 @@
+"""Memory-mapped access to the weight matrix of a trained NDL model.
+
+pyndl saves the weights as an outcome x cue netCDF file. The first time a weight file is opened it
+is copied block by block into an .npy sidecar next to it (optionally downcast to float32),
+together with the cue and outcome labels. Afterwards the sidecar is memory-mapped, so the matrix
+is never held in memory twice and is never transposed.
+
+With a magnitude threshold, SparseWeightStore keeps only the weights above it in a CSR matrix
+saved as .npz instead. Most cue-outcome pairs, e.g. context cues to unrelated words, are zero or
+tiny, so the sparse matrix is a fraction of the size of the dense one on disk and in memory.
+
+WeightStore and SparseWeightStore expose the same attributes the functions in
+variablesOtherPrior.py use on the pandas weight matrix (index = cues, columns = outcomes, values,
+at[cue, outcome]), so they can be passed to them directly.
+
+Usage:
+    from weight_store import WeightStore
+
+    weight_matrix = WeightStore.from_netcdf("../output/weights/weights_buckeye.nc")
+    sparse_matrix = SparseWeightStore.from_netcdf("../output/weights/weights_buckeye.nc", 1e-6)
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import sparse
+
+from event_index import read_vocabulary, write_vocabulary
+
+
+def sidecar_paths(path, dtype=np.float64) -> tuple:
+    """Returns the paths of the .npy sidecar and the cue and outcome label files of a weight
+    file."""
+    root, extension = os.path.splitext(path)
+    root = root + "." + np.dtype(dtype).name
+    return root + ".npy", root + ".cues.txt", root + ".outcomes.txt"
+
+
+def sparse_sidecar_paths(path, dtype=np.float64, threshold=0.0) -> tuple:
+    """Returns the paths of the .npz sidecar and the cue and outcome label files of a weight file
+    thresholded at threshold."""
+    root, extension = os.path.splitext(path)
+    root = "{}.{}.sparse{:g}".format(root, np.dtype(dtype).name, threshold)
+    return root + ".npz", root + ".cues.txt", root + ".outcomes.txt"
+
+
+def is_stale(sidecar, path) -> bool:
+    """Returns whether a sidecar is missing or older than the weight file it was exported from."""
+    return not os.path.exists(sidecar) or os.path.getmtime(sidecar) < os.path.getmtime(
+        path
+    )
+
+
+class CellAccessor:
+    """Label based cell access, as DataFrame.at."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, key):
+        cue, outcome = key
+        return self.store.cell(cue, outcome)
+
+
+class WeightStore:
+    """An outcome x cue weight matrix with label lookups.
+
+    Input:
+    -----
+    matrix - numpy.ndarray
+        The outcome x cue weights, usually a read-only memmap.
+    cues - list of str
+    outcomes - list of str
+    """
+
+    def __init__(self, matrix, cues, outcomes):
+        self.matrix = matrix
+        self.index = pd.Index(cues)
+        self.columns = pd.Index(outcomes)
+        self.cue_ids = {cue: index for index, cue in enumerate(cues)}
+        self.outcome_ids = {outcome: index for index, outcome in enumerate(outcomes)}
+        self.at = CellAccessor(self)
+
+    @classmethod
+    def export(cls, path, dtype=np.float64, block_size=1024):
+        """Copies a netCDF weight file into an .npy sidecar, block_size outcomes at a time."""
+        matrix_path, cues_path, outcomes_path = sidecar_paths(path, dtype)
+        weights = xr.open_dataarray(path).transpose("outcomes", "cues")
+        matrix = np.lib.format.open_memmap(
+            matrix_path + ".tmp", mode="w+", dtype=dtype, shape=weights.shape
+        )
+        for start in range(0, weights.shape[0], block_size):
+            matrix[start : start + block_size] = weights[
+                start : start + block_size
+            ].values
+        matrix.flush()
+        del matrix
+        weights.close()
+
+        write_vocabulary(cues_path, [str(cue) for cue in weights.coords["cues"].values])
+        write_vocabulary(
+            outcomes_path,
+            [str(outcome) for outcome in weights.coords["outcomes"].values],
+        )
+        os.replace(matrix_path + ".tmp", matrix_path)
+
+    @classmethod
+    def load(cls, path, dtype=np.float64):
+        """Memory-maps the sidecar of a weight file."""
+        matrix_path, cues_path, outcomes_path = sidecar_paths(path, dtype)
+        return cls(
+            np.load(matrix_path, mmap_mode="r"),
+            read_vocabulary(cues_path),
+            read_vocabulary(outcomes_path),
+        )
+
+    @classmethod
+    def from_netcdf(cls, path, dtype=np.float64):
+        """Memory-maps a netCDF weight file, exporting its sidecar first if it is missing or older
+        than the weight file."""
+        matrix_path, _, _ = sidecar_paths(path, dtype)
+        if is_stale(matrix_path, path):
+            cls.export(path, dtype=dtype)
+        return cls.load(path, dtype=dtype)
+
+    @property
+    def values(self) -> np.ndarray:
+        """The cue x outcome weights, as a transposed view of the stored matrix."""
+        return self.matrix.T
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    def row(self, cue) -> np.ndarray:
+        """Returns the weights of a cue to all outcomes, without copying."""
+        return self.matrix[:, self.cue_ids[cue]]
+
+    def column(self, outcome) -> np.ndarray:
+        """Returns the weights of all cues to an outcome, without copying."""
+        return self.matrix[self.outcome_ids[outcome]]
+
+    def cell(self, cue, outcome) -> float:
+        """Returns the weight of a cue to an outcome."""
+        return self.matrix[self.outcome_ids[outcome], self.cue_ids[cue]]
+
+    def __getitem__(self, outcome) -> np.ndarray:
+        return self.column(outcome)
+
+    def __repr__(self):
+        return "WeightStore: {} cues x {} outcomes, {}, {:.1f} MB".format(
+            len(self.index),
+            len(self.columns),
+            self.matrix.dtype,
+            self.matrix.nbytes / 1e6,
+        )
+
+
+class SparseWeightStore(WeightStore):
+    """An outcome x cue weight matrix stored as a scipy.sparse CSR matrix.
+
+    Input:
+    -----
+    matrix - scipy.sparse.csr_matrix
+        The outcome x cue weights.
+    cues - list of str
+    outcomes - list of str
+    """
+
+    @classmethod
+    def export(cls, path, dtype=np.float64, threshold=0.0, block_size=1024):
+        """Copies the weights of a netCDF weight file whose magnitude is above threshold into an
+        .npz sidecar, block_size outcomes at a time."""
+        matrix_path, cues_path, outcomes_path = sparse_sidecar_paths(
+            path, dtype, threshold
+        )
+        weights = xr.open_dataarray(path).transpose("outcomes", "cues")
+        blocks = []
+        for start in range(0, weights.shape[0], block_size):
+            block = weights[start : start + block_size].values.astype(dtype)
+            block[np.absolute(block) <= threshold] = 0
+            blocks.append(sparse.csr_matrix(block))
+        weights.close()
+
+        # np.savez adds .npz to names without it, so the temporary file ends in .npz as well.
+        sparse.save_npz(matrix_path + ".tmp.npz", sparse.vstack(blocks, format="csr"))
+        write_vocabulary(cues_path, [str(cue) for cue in weights.coords["cues"].values])
+        write_vocabulary(
+            outcomes_path,
+            [str(outcome) for outcome in weights.coords["outcomes"].values],
+        )
+        os.replace(matrix_path + ".tmp.npz", matrix_path)
+
+    @classmethod
+    def load(cls, path, dtype=np.float64, threshold=0.0):
+        """Loads the sparse sidecar of a weight file."""
+        matrix_path, cues_path, outcomes_path = sparse_sidecar_paths(
+            path, dtype, threshold
+        )
+        return cls(
+            sparse.load_npz(matrix_path).tocsr(),
+            read_vocabulary(cues_path),
+            read_vocabulary(outcomes_path),
+        )
+
+    @classmethod
+    def from_netcdf(cls, path, threshold=0.0, dtype=np.float64):
+        """Loads a netCDF weight file as a sparse matrix, exporting its sidecar first if it is
+        missing or older than the weight file."""
+        matrix_path, _, _ = sparse_sidecar_paths(path, dtype, threshold)
+        if is_stale(matrix_path, path):
+            cls.export(path, dtype=dtype, threshold=threshold)
+        return cls.load(path, dtype=dtype, threshold=threshold)
+
+    @property
+    def values(self) -> sparse.csc_matrix:
+        """The cue x outcome weights, as the transposed CSC view of the stored matrix."""
+        return self.matrix.T
+
+    def row(self, cue) -> np.ndarray:
+        """Returns the weights of a cue to all outcomes."""
+        return self.matrix[:, self.cue_ids[cue]].toarray().ravel()
+
+    def column(self, outcome) -> np.ndarray:
+        """Returns the weights of all cues to an outcome."""
+        return self.matrix[self.outcome_ids[outcome]].toarray().ravel()
+
+    def cell(self, cue, outcome) -> float:
+        """Returns the weight of a cue to an outcome."""
+        return self.matrix[self.outcome_ids[outcome], self.cue_ids[cue]]
+
+    def __repr__(self):
+        nbytes = (
+            self.matrix.data.nbytes
+            + self.matrix.indices.nbytes
+            + self.matrix.indptr.nbytes
+        )
+        return "SparseWeightStore: {} cues x {} outcomes, {}, {} non-zero, {:.1f} MB".format(
+            len(self.index),
+            len(self.columns),
+            self.matrix.dtype,
+            self.matrix.nnz,
+            nbytes / 1e6,
+        )
@@ -0,0 +1,29 @@
+"""The word cue table: the segment and syllable cues of every word type.
+
+eventfilesV1.py builds the events from the table and saves it, prior_activation.py reads it back,
+so the activations use exactly the cue sets the model was trained on.
+
+Usage:
+    from word_cues import read_word_cues, write_word_cues
+
+    write_word_cues(table)  # a DataFrame with the column 'cues', indexed by word
+    word_cues = read_word_cues()
+"""
+
+import pandas as pd
+
+WORD_CUES = "../data/word_cues.tsv"
+
+
+def write_word_cues(table, path=WORD_CUES):
+    table.to_csv(path, sep="\t")
+
+
+def read_word_cues(path=WORD_CUES) -> dict:
+    """Return a dict of word -> segment and syllable cues, in the form first_event_cues of
+    token_activations.py returns."""
+    table = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+    return {
+        word: sorted(set(filter(None, cues.split("_"))))
+        for word, cues in zip(table["word"], table["cues"])
+    }